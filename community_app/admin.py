@@ -1,5 +1,7 @@
+from django import forms
 from django.contrib import admin
 from .models import Room, Post, PostCategory, PostComment, PostLike, Tag, RoomMessage
+from .posts import MAX_POST_TAGS
 
 
 class RoomAdmin(admin.ModelAdmin):
@@ -10,7 +12,20 @@ class RoomMessageAdmin(admin.ModelAdmin):
     list_display = ["room", "user", "text_message"]
 
 
+class PostAdminForm(forms.ModelForm):
+    class Meta:
+        model = Post
+        fields = "__all__"
+
+    def clean_tags(self):
+        tags = self.cleaned_data["tags"]
+        if len(tags) > MAX_POST_TAGS:
+            raise forms.ValidationError(f"You cannot add more than {MAX_POST_TAGS} tags to post")
+        return tags
+
+
 class PostAdmin(admin.ModelAdmin):
+    form = PostAdminForm
     list_display = ["title", "content", "author", "category"]
 
 
@@ -1,31 +1,39 @@
+import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from .media import MediaUpload, MediaUploadError, store_single_frame_media, store_upload_media
 from .models import Room, RoomType, RoomMessage
+from .presence import presence
+from .rooms import get_or_create_room_id
+from .write_buffer import message_buffer, room_member_buffer
 
 
-async def create_room(room_name, room_type):
-    # Check if the room already exists
-    try:
-        room = await database_sync_to_async(Room.objects.get)(name=room_name)
-    except Room.DoesNotExist:
-        room = await database_sync_to_async(Room.objects.create)(name=room_name, room_type=room_type)
-
-    return room
+CONTROL_FRAME_TYPES = {"media_start", "heartbeat", "typing", "online"}
 
 
-async def save_message(room, user, text_message=None, media_message=None):
-    await database_sync_to_async(RoomMessage.objects.create)(
-        room=room,
-        user=user,
-        text_message=text_message,
-        media_message=media_message,
-    )
+def parse_control_frame(text_data):
+    """
+    Return the decoded control frame if text_data is one, e.g.
+    {"type": "media_start", "filename": "photo.jpg", "size": 123456}, {"type": "heartbeat"},
+    {"type": "typing"} or {"type": "online"}. Anything else is a plain chat message.
+    """
+    if not text_data.startswith("{"):
+        return None
+    try:
+        control = json.loads(text_data)
+    except ValueError:
+        return None
+    if not isinstance(control, dict) or control.get("type") not in CONTROL_FRAME_TYPES:
+        return None
+    return control
 
 
 class ChatRoomConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
         self.chat_room_name = self.scope["url_route"]["kwargs"].get("chat_room_name")
+        self.room_id = await get_or_create_room_id(self.chat_room_name, RoomType.chat)
+        self.media_upload = None
+        self.media_rejected = False  # chunks of a rejected or aborted upload are dropped until the next media_start
 
         await self.channel_layer.group_add(
             self.chat_room_name,
@@ -34,18 +42,32 @@ class ChatRoomConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        if self.user.is_authenticated:
+            await room_member_buffer.put(Room.members.through(room_id=self.room_id, customuser_id=self.user.id))
+            await presence.touch(self.chat_room_name, self.user.username, self.channel_name)
+            await self.send_presence_event("join")
+
     async def disconnect(self, code):
         print(f"🚨 DISCONNECTED, CODE: {code}")
+        self.discard_media_upload()
+        if self.user.is_authenticated:
+            if await presence.leave(self.chat_room_name, self.user.username, self.channel_name):
+                await self.send_presence_event("leave")
         await self.channel_layer.group_discard(
             self.chat_room_name,
             self.channel_name,
         )
 
     async def receive(self, text_data=None, bytes_data=None):
-        print(f"TEXT_DATA> {text_data}, TYPE> {type(text_data)}\n BYTES_DATA> {bytes_data[:10]}..., TYPE> {type(bytes_data)}" if bytes_data else f"TEXT_DATA> {text_data}, TYPE> {type(text_data)}\n BYTES_DATA> None, TYPE> None")
+        print(f"TEXT_DATA> {text_data}, TYPE> {type(text_data)}\n BYTES_DATA> {len(bytes_data)} bytes" if bytes_data else f"TEXT_DATA> {text_data}, TYPE> {type(text_data)}\n BYTES_DATA> None, TYPE> None")
         if text_data:
-            room = await create_room(self.chat_room_name, RoomType.chat)
-            await save_message(room, self.user, text_message=text_data)
+            control = parse_control_frame(text_data)
+            if control is not None:
+                await self.receive_control_frame(control)
+                return
+
+            # persisted by the write-behind buffer, the broadcast does not wait for the insert
+            await message_buffer.put(RoomMessage(room_id=self.room_id, user=self.user, text_message=text_data))
             await self.channel_layer.group_send(
                 self.chat_room_name,
                 {
@@ -54,16 +76,79 @@ class ChatRoomConsumer(AsyncWebsocketConsumer):
                 }
             )
         if bytes_data:
-            room = await create_room(self.chat_room_name, RoomType.chat)
-            await save_message(room, self.user, media_message=bytes_data)
+            if self.media_rejected:
+                return
+            try:
+                if self.media_upload is None:
+                    media_key, media_url = await store_single_frame_media(bytes_data)
+                    media_size = len(bytes_data)
+                else:
+                    self.media_upload.write(bytes_data)
+                    if not self.media_upload.complete:
+                        return
+                    media_key, media_url = await store_upload_media(self.media_upload)
+                    media_size = self.media_upload.size
+                    self.discard_media_upload()
+            except MediaUploadError as e:
+                self.media_rejected = self.media_upload is not None
+                self.discard_media_upload()
+                await self.send_error(str(e))
+                return
+
+            # only the object key travels through the channel layer, clients fetch the bytes from storage
+            await message_buffer.put(RoomMessage(room_id=self.room_id, user=self.user, media_message=media_key))
             await self.channel_layer.group_send(
                 self.chat_room_name,
                 {
                     "type": "media_message",
-                    "bytes_data": bytes_data,
+                    "media_key": media_key,
+                    "media_url": media_url,
+                    "size": media_size,
+                    "user": self.user.username,
                 }
             )
 
+    async def receive_control_frame(self, control):
+        control_type = control["type"]
+        if control_type == "media_start":
+            await self.start_media_upload(control.get("filename") or "", control.get("size"))
+        elif control_type == "heartbeat" and self.user.is_authenticated:
+            await presence.touch(self.chat_room_name, self.user.username, self.channel_name)
+        elif control_type == "typing" and self.user.is_authenticated:
+            await self.send_presence_event("typing")
+        elif control_type == "online":
+            await self.send(text_data=json.dumps({
+                "type": "online",
+                "users": await presence.online(self.chat_room_name),
+            }))
+
+    async def send_presence_event(self, event):
+        await self.channel_layer.group_send(
+            self.chat_room_name,
+            {
+                "type": "presence_message",
+                "event": event,
+                "user": self.user.username,
+            }
+        )
+
+    async def start_media_upload(self, filename, size):
+        self.discard_media_upload()
+        self.media_rejected = False
+        try:
+            self.media_upload = MediaUpload(filename, size)
+        except MediaUploadError as e:
+            self.media_rejected = True
+            await self.send_error(str(e))
+
+    def discard_media_upload(self):
+        if self.media_upload is not None:
+            self.media_upload.close()
+            self.media_upload = None
+
+    async def send_error(self, detail):
+        await self.send(text_data=json.dumps({"type": "error", "detail": detail}))
+
     async def chat_message(self, event):
         text_message = event["text_data"]
         print(f"EVENT> {event}, TYPE> {type(event)}\n TEXT_MESSAGE> {text_message}, TYPE> {type(text_message)}")
@@ -71,7 +156,21 @@ class ChatRoomConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=text_message)
 
     async def media_message(self, event):
-        bytes_message = event["bytes_data"]
-        print(f"EVENT> {event}, TYPE> {type(event)}\n BYTES_MESSAGE> {bytes_message[:10]}..., TYPE> {type(bytes_message)}")
+        print(f"EVENT> {event}, TYPE> {type(event)}")
+
+        await self.send(text_data=json.dumps({
+            "type": "media_message",
+            "media_key": event["media_key"],
+            "media_url": event["media_url"],
+            "size": event["size"],
+            "user": event["user"],
+        }))
+
+    async def presence_message(self, event):
+        if event["event"] == "typing" and event["user"] == self.user.username:
+            return
 
-        await self.send(bytes_data=bytes_message)
+        await self.send(text_data=json.dumps({
+            "type": event["event"],
+            "user": event["user"],
+        }))
@@ -0,0 +1,187 @@
+from datetime import timedelta
+from uuid import UUID, uuid4
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import CommentLike, LikeFlush, Post, PostComment, PostLike
+
+
+# kind -> (liked model, like model, column of the like model pointing at the liked object)
+LIKEABLE = {
+    "post": (Post, PostLike, "post_id"),
+    "comment": (PostComment, CommentLike, "comment_id"),
+}
+UPDATE_CHUNK_SIZE = 500
+FLUSH_ID_FIELD = "flush_id"  # stored in the batch hash next to the object ids
+FLUSH_LOCK_TIMEOUT = 60
+FLUSH_ID_RETENTION = timedelta(days=1)
+
+
+def apply_like_deltas(model, deltas):
+    """{object id: delta} applied with one UPDATE per chunk of ids, a counter never goes below zero"""
+    object_ids = list(deltas)
+    for start in range(0, len(object_ids), UPDATE_CHUNK_SIZE):
+        chunk = object_ids[start:start + UPDATE_CHUNK_SIZE]
+        delta = Case(
+            *(When(id=object_id, then=Value(deltas[object_id])) for object_id in chunk),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        model.objects.filter(id__in=chunk).update(likes_count=Greatest(F("likes_count") + delta, Value(0)))
+
+
+class DatabaseLikeCounters:
+    """counters updated with every like, used when no Redis is configured"""
+
+    async def add(self, kind, object_id, delta):
+        await sync_to_async(apply_like_deltas)(LIKEABLE[kind][0], {object_id: delta})
+
+    async def pending(self, kind, object_ids):
+        return {}
+
+    def flush(self):
+        return 0
+
+
+class RedisLikeCounters:
+    """
+    Like counter deltas buffered in Redis: likes:pending:{kind} hash, field=object id, value=delta.
+    flush(), run by Celery beat, moves the hash aside with RENAME and applies it in a few UPDATEs,
+    so a hot post costs one row write per flush interval instead of one per like.
+    """
+
+    def __init__(self, url):
+        import redis
+        from redis import asyncio as aredis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.aredis = aredis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def get_key(kind):
+        return f"likes:pending:{kind}"
+
+    async def add(self, kind, object_id, delta):
+        await self.aredis.hincrby(self.get_key(kind), str(object_id), delta)
+
+    async def pending(self, kind, object_ids):
+        """deltas not in the database yet, including the batch being flushed right now: one pipeline"""
+        if not object_ids:
+            return {}
+        fields = [str(object_id) for object_id in object_ids]
+        key = self.get_key(kind)
+        async with self.aredis.pipeline(transaction=False) as pipe:
+            pipe.hmget(key, fields)
+            pipe.hmget(f"{key}:flushing", fields)
+            pending_deltas, flushing_deltas = await pipe.execute()
+        deltas = {}
+        for object_id, pending_delta, flushing_delta in zip(object_ids, pending_deltas, flushing_deltas):
+            delta = int(pending_delta or 0) + int(flushing_delta or 0)
+            if delta:
+                deltas[object_id] = delta
+        return deltas
+
+    def take_batch(self, key, flushing_key):
+        """
+        The batch to apply: the one a dead flush left behind, or the pending hash moved aside. The rename and the
+        flush id are written in one MULTI, so a batch always carries the id it is recorded under once applied.
+        """
+        if not self.redis.exists(flushing_key):
+            if not self.redis.exists(key):
+                return None, {}
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.rename(key, flushing_key)
+            pipe.hset(flushing_key, FLUSH_ID_FIELD, str(uuid4()))
+            pipe.execute()
+        batch = self.redis.hgetall(flushing_key)
+        flush_id = batch.pop(FLUSH_ID_FIELD, None) or str(uuid4())
+        return flush_id, {UUID(object_id): int(delta) for object_id, delta in batch.items() if int(delta)}
+
+    def flush(self):
+        """
+        Apply the buffered deltas, return how many counters were updated. The flush id is inserted in the same
+        transaction as the UPDATEs, so a batch whose hash outlived its commit (a crash before the DELETE) is
+        dropped instead of applied twice.
+        """
+        from redis.exceptions import LockError
+
+        lock = self.redis.lock("likes:flush:lock", timeout=FLUSH_LOCK_TIMEOUT, blocking=False)
+        if not lock.acquire():
+            return 0  # the previous flush is still running
+
+        flushed = 0
+        try:
+            for kind, (model, like_model, field_name) in LIKEABLE.items():
+                key = self.get_key(kind)
+                flushing_key = f"{key}:flushing"
+                flush_id, deltas = self.take_batch(key, flushing_key)
+                if flush_id is None:
+                    continue
+                lock.reacquire()  # raises LockNotOwnedError when a long flush outlived the lock, nothing is lost
+                with transaction.atomic():
+                    _, created = LikeFlush.objects.get_or_create(id=flush_id)
+                    if created:
+                        apply_like_deltas(model, deltas)
+                        flushed += len(deltas)
+                self.redis.delete(flushing_key)
+            LikeFlush.objects.filter(created_time__lt=timezone.now() - FLUSH_ID_RETENTION).delete()
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                pass  # expired and maybe taken by the next flush, which is not ours to release
+        return flushed
+
+
+def get_like_counters():
+    if settings.LIKE_COUNTS_REDIS_URL:
+        return RedisLikeCounters(settings.LIKE_COUNTS_REDIS_URL)
+    return DatabaseLikeCounters()
+
+
+like_counters = get_like_counters()
+
+
+async def like(kind, object_id, user_id):
+    """
+    Idempotent like, INSERT with the unique (object, user) constraint settling duplicates: one query.
+    Returns True when this call liked, False when it was liked already. Raises DoesNotExist for a missing object.
+    """
+    model, like_model, field_name = LIKEABLE[kind]
+    try:
+        await like_model.objects.acreate(**{field_name: object_id, "user_id": user_id})
+    except IntegrityError:
+        if await like_model.objects.filter(**{field_name: object_id, "user_id": user_id}).aexists():
+            return False
+        raise model.DoesNotExist(f"{kind} {object_id} not found")
+    await like_counters.add(kind, object_id, 1)
+    return True
+
+
+async def unlike(kind, object_id, user_id):
+    """idempotent unlike, True when a like was removed"""
+    model, like_model, field_name = LIKEABLE[kind]
+    deleted, _ = await like_model.objects.filter(**{field_name: object_id, "user_id": user_id}).adelete()
+    if deleted:
+        await like_counters.add(kind, object_id, -1)
+    return bool(deleted)
+
+
+async def liked_by(kind, user_id, object_ids):
+    """the ids of a page the user liked, one query whatever the page size"""
+    model, like_model, field_name = LIKEABLE[kind]
+    if not object_ids:
+        return set()
+    likes = like_model.objects.filter(user_id=user_id, **{f"{field_name}__in": object_ids})
+    return {object_id async for object_id in likes.values_list(field_name, flat=True)}
+
+
+async def get_like_context(kind, user_id, object_ids):
+    """serializer context for a page: which objects the user liked and the counter deltas not flushed yet"""
+    return {
+        "liked_ids": await liked_by(kind, user_id, object_ids),
+        "pending_likes": await like_counters.pending(kind, object_ids),
+    }
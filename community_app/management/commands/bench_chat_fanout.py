@@ -0,0 +1,147 @@
+import asyncio
+import json
+import tracemalloc
+from statistics import quantiles
+from time import perf_counter
+from uuid import uuid4
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from community_app.models import Room
+from community_app.rooms import room_id_cache
+from community_app.routing import websocket_urlpatterns
+from community_app.write_buffer import message_buffer, room_member_buffer
+
+
+CustomUser = get_user_model()
+
+
+class QueryCounter:
+    """execute wrapper installed on the shared database_sync_to_async thread's connection"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test ChatRoomConsumer: N rooms x M clients sending at a fixed rate. Reports p50/p99 delivery latency, "
+        "messages/s, DB queries per message and memory per connection. Bench users and rooms are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=10)
+        parser.add_argument("--clients", type=int, default=10, help="clients per room")
+        parser.add_argument("--rate", type=float, default=2, help="messages per second per client")
+        parser.add_argument("--duration", type=float, default=10, help="seconds")
+        parser.add_argument("--redis", action="store_true", help="use the configured CHANNEL_LAYERS instead of in-memory")
+
+    def handle(self, *args, **options):
+        if options["redis"]:
+            asyncio.run(self.run(**options))
+        else:
+            in_memory_layer = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer", "CONFIG": {"capacity": 10_000}}}
+            with override_settings(CHANNEL_LAYERS=in_memory_layer):
+                asyncio.run(self.run(**options))
+
+    async def run(self, rooms, clients, rate, duration, **options):
+        prefix = f"bench_{uuid4().hex[:8]}"
+        users = await database_sync_to_async(self.create_users)(prefix, rooms * clients)
+        try:
+            await self.bench(prefix, users, rooms, clients, rate, duration)
+        finally:
+            await database_sync_to_async(self.cleanup)(prefix)
+
+    @staticmethod
+    def create_users(prefix, count):
+        return CustomUser.objects.bulk_create(
+            [CustomUser(username=f"{prefix}_{i}", password="!") for i in range(count)]
+        )
+
+    @staticmethod
+    def cleanup(prefix):
+        Room.objects.filter(name__startswith=prefix).delete()
+        CustomUser.objects.filter(username__startswith=prefix).delete()
+        room_id_cache.clear()
+
+    async def bench(self, prefix, users, rooms, clients, rate, duration):
+        application = URLRouter(websocket_urlpatterns)
+        query_counter = QueryCounter()
+        await database_sync_to_async(connection.execute_wrappers.append)(query_counter)
+
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        communicators = []
+        for room_index in range(rooms):
+            for client_index in range(clients):
+                communicator = WebsocketCommunicator(application, f"/ws/chat/{prefix}_{room_index}/")
+                communicator.scope["user"] = users[room_index * clients + client_index]
+                connected, _ = await communicator.connect()
+                assert connected
+                communicators.append(communicator)
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - memory_before) / len(communicators)
+        tracemalloc.stop()
+
+        # drain join events so they don't count as chat deliveries
+        await asyncio.sleep(0.5)
+        for communicator in communicators:
+            while not await communicator.receive_nothing(timeout=0.01):
+                await communicator.receive_from()
+
+        await message_buffer.flush()
+        await room_member_buffer.flush()
+        queries_before = query_counter.count
+
+        latencies = []
+        sent = 0
+        stop_at = perf_counter() + duration
+
+        async def sender(communicator):
+            nonlocal sent
+            interval = 1 / rate
+            while perf_counter() < stop_at:
+                await communicator.send_to(text_data=json.dumps({"sent": perf_counter()}))
+                sent += 1
+                await asyncio.sleep(interval)
+
+        async def receiver(communicator):
+            # polled with receive_nothing(): a receive_from() timeout cancels the consumer before disconnect()
+            last_frame_at = perf_counter()
+            while True:
+                if await communicator.receive_nothing(timeout=0.05):
+                    now = perf_counter()
+                    if now >= stop_at and now - last_frame_at >= 2:
+                        return
+                    continue
+                payload = json.loads(await communicator.receive_from())
+                last_frame_at = perf_counter()
+                if "sent" in payload:
+                    latencies.append(last_frame_at - payload["sent"])
+
+        await asyncio.gather(
+            *(sender(communicator) for communicator in communicators),
+            *(receiver(communicator) for communicator in communicators),
+        )
+        await message_buffer.flush()
+        queries = query_counter.count - queries_before
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        await room_member_buffer.flush()
+        await database_sync_to_async(connection.execute_wrappers.remove)(query_counter)
+
+        p50, p99 = (quantiles(latencies, n=100)[i] for i in (49, 98)) if len(latencies) > 1 else (0, 0)
+        self.stdout.write(f"rooms={rooms} clients/room={clients} rate={rate}/s duration={duration}s")
+        self.stdout.write(f"sent={sent} delivered={len(latencies)} expected={sent * clients}")
+        self.stdout.write(f"messages/s={sent / duration:.1f} deliveries/s={len(latencies) / duration:.1f}")
+        self.stdout.write(f"latency p50={p50 * 1000:.2f}ms p99={p99 * 1000:.2f}ms")
+        self.stdout.write(f"db queries/message={queries / sent if sent else 0:.3f}")
+        self.stdout.write(f"memory/connection={memory_per_connection / 1024:.1f}KiB")
@@ -0,0 +1,65 @@
+from time import perf_counter
+from uuid import uuid4
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from community_app.models import Room, RoomMessage
+from community_app.serializers import RoomMessageSerializer
+
+
+CustomUser = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare query count and latency of chat history serialization paths, data is rolled back afterwards"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10_000)
+        parser.add_argument("--users", type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options["messages"], options["users"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, messages_count, users_count):
+        suffix = uuid4().hex[:8]
+        room = Room.objects.create(name=f"bench_{suffix}")
+        users = CustomUser.objects.bulk_create(
+            [CustomUser(username=f"bench_{suffix}_{i}", password="!") for i in range(users_count)]
+        )
+        RoomMessage.objects.bulk_create(
+            [
+                RoomMessage(room=room, user=users[i % users_count], text_message=f"message {i}")
+                for i in range(messages_count)
+            ],
+            batch_size=1000,
+        )
+
+        queryset = RoomMessage.objects.filter(room=room).order_by("created_time", "id")
+        paths = {
+            "before (per-row room/user lookups)": lambda: RoomMessageSerializer(queryset, many=True).data,
+            "select_related": lambda: RoomMessageSerializer(
+                RoomMessageSerializer.with_related(queryset), many=True
+            ).data,
+            "values() + serialize_many": lambda: RoomMessageSerializer.serialize_many(
+                RoomMessageSerializer.as_values(queryset)
+            ),
+        }
+
+        self.stdout.write(f"{messages_count} messages, {users_count} users")
+        for name, serialize in paths.items():
+            with CaptureQueriesContext(connection) as queries:
+                started = perf_counter()
+                data = serialize()
+                elapsed = perf_counter() - started
+            assert len(data) == messages_count
+            self.stdout.write(f"{name:<40} queries={len(queries):<7} time={elapsed * 1000:.1f}ms")
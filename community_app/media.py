@@ -0,0 +1,69 @@
+import os
+from asyncio import to_thread
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from shared_app.content_store import new_hasher, store_content
+
+
+class MediaUploadError(Exception):
+    pass
+
+
+class MediaUpload:
+    """
+    Chunked media upload of one WebSocket connection.
+    Chunks are spooled in memory up to CHAT_MEDIA_SPOOL_SIZE and then to a temporary file on disk.
+    """
+
+    def __init__(self, filename, size):
+        if not isinstance(size, int) or size <= 0:
+            raise MediaUploadError("Media size must be a positive integer.")
+        if size > settings.CHAT_MEDIA_MAX_SIZE:
+            raise MediaUploadError(f"Media must be {settings.CHAT_MEDIA_MAX_SIZE} bytes or less.")
+        self.filename = filename
+        self.size = size
+        self.received = 0
+        self.file = SpooledTemporaryFile(max_size=settings.CHAT_MEDIA_SPOOL_SIZE)
+        self.hasher = new_hasher()  # content hash computed while chunks stream in
+
+    @property
+    def complete(self):
+        return self.received == self.size
+
+    def write(self, chunk):
+        if self.received + len(chunk) > self.size:
+            raise MediaUploadError("Received more media bytes than announced.")
+        self.file.write(chunk)
+        self.hasher.update(chunk)
+        self.received += len(chunk)
+
+    def close(self):
+        self.file.close()
+
+
+def get_media_extension(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")[:10] if filename else ""
+    return extension or "bin"
+
+
+async def store_media(fileobj, filename=None, digest=None, size=None):
+    """store fileobj content-addressed in default_storage (local or S3), return (key, url)"""
+    media_key = await to_thread(store_content, fileobj, get_media_extension(filename), digest, size)
+    media_url = await to_thread(default_storage.url, media_key)
+    return media_key, media_url
+
+
+async def store_upload_media(media_upload):
+    return await store_media(
+        media_upload.file, media_upload.filename, media_upload.hasher.hexdigest(), media_upload.size,
+    )
+
+
+async def store_single_frame_media(bytes_data):
+    if len(bytes_data) > settings.CHAT_MEDIA_MAX_SIZE:
+        raise MediaUploadError(f"Media must be {settings.CHAT_MEDIA_MAX_SIZE} bytes or less.")
+    hasher = new_hasher()
+    hasher.update(bytes_data)
+    return await store_media(BytesIO(bytes_data), digest=hasher.hexdigest(), size=len(bytes_data))
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community_app', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='roommessage',
+            index=models.Index(fields=['room', 'created_time', 'id'], name='room_message_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community_app', '0003_roommessage_room_message_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postcomment',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community_app', '0004_postcomment_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_time'], name='post_author_time_idx'),
+        ),
+    ]
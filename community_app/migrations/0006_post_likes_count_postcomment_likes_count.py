@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:45
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_likes_count(apps, schema_editor):
+    for model_name, like_model_name, field_name in (('Post', 'PostLike', 'post'), ('PostComment', 'CommentLike', 'comment')):
+        model = apps.get_model('community_app', model_name)
+        like_model = apps.get_model('community_app', like_model_name)
+        counts = like_model.objects.filter(**{field_name: OuterRef('pk')}).order_by().values(field_name).annotate(
+            count=Count('id')
+        ).values('count')
+        model.objects.update(likes_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community_app', '0005_post_post_author_time_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='postcomment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_likes_count, migrations.RunPython.noop),
+    ]
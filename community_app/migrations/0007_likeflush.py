@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:39
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community_app', '0006_post_likes_count_postcomment_likes_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LikeFlush',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('updated_time', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
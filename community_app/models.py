@@ -34,15 +34,15 @@ class Post(BaseModel):
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     category = models.ForeignKey(PostCategory, on_delete=models.CASCADE)
     tags = models.ManyToManyField(Tag, related_name="posts")
+    likes_count = models.PositiveIntegerField(default=0)  # flushed in batches, see community_app.likes
 
-    def clean(self):
-        super().clean()
-        if self.tags.count() > 5:
-            raise ValidationError('You cannot add more than 5 tags to post')
+    class Meta:
+        indexes = [
+            # newest posts of a set of authors: timeline rebuilds and the celebrity merge, see community_app.timelines
+            models.Index(fields=["author", "-created_time"], name="post_author_time_idx"),
+        ]
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+    # the 5-tag limit is checked on the incoming tag list, see community_app.posts
 
     def __str__(self):
         words = self.title.split()
@@ -57,6 +57,8 @@ class PostComment(BaseModel):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="post_comments")
     comment = models.CharField(max_length=255, null=True, blank=True)
     image = models.ImageField(upload_to='comment_gifs/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True)  # {"image": {"64": name, ...}}
+    likes_count = models.PositiveIntegerField(default=0)  # flushed in batches, see community_app.likes
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
 
     def __str__(self):
@@ -90,6 +92,13 @@ class CommentLike(BaseModel):
         return f"{self.user} likes {self.comment}"
 
 
+class LikeFlush(BaseModel):
+    """id of a like counter batch already applied, written in the same transaction as its counter updates"""
+
+    def __str__(self):
+        return f"Like flush {self.id}"
+
+
 class RoomType(models.TextChoices):
     chat = "chat", "chat"
     group = "group", "group"
@@ -105,14 +114,11 @@ class Room(BaseModel):
         return f"Room: {self.name}"
 
     def add_member(self, user):
-        if self.room_type == RoomType.group:
-            print(f"user: {user}")
-        # self.members.add(user)
+        # WebSocket joins are batched through community_app.write_buffer.room_member_buffer instead
+        self.members.add(user)
 
     def remove_member(self, user):
-        if self.room_type == RoomType.group:
-            print(f"user: {user}")
-        # self.members.remove(user)
+        self.members.remove(user)
 
 
 class RoomMessage(BaseModel, DirtyFieldsMixin):
@@ -122,6 +128,12 @@ class RoomMessage(BaseModel, DirtyFieldsMixin):
     text_message = models.TextField(null=True, blank=True)
     media_message = models.FileField(upload_to=user_directory_path, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination of chat history, see community_app.pagination
+            models.Index(fields=["room", "created_time", "id"], name="room_message_keyset_idx"),
+        ]
+
     def __str__(self):
         return f"Message by {self.user} in {self.room.name}"
 
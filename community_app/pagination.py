@@ -0,0 +1,83 @@
+import base64
+import binascii
+from datetime import datetime
+from uuid import UUID
+from django.conf import settings
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(created_time, message_id):
+    """(created_time, id) -> opaque url-safe cursor"""
+    raw = f"{created_time.isoformat()}|{message_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """opaque url-safe cursor -> (created_time, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_time, message_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_time), UUID(message_id)
+    except (ValueError, UnicodeError, binascii.Error) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def get_page_size(limit):
+    max_page_size = settings.CHAT_HISTORY_MAX_PAGE_SIZE
+    if limit is None:
+        return min(settings.CHAT_HISTORY_PAGE_SIZE, max_page_size)
+    try:
+        return max(1, min(int(limit), max_page_size))
+    except (TypeError, ValueError):
+        raise InvalidCursor(f"Invalid limit: {limit}")
+
+
+def _cursor_of(message):
+    if isinstance(message, dict):
+        return encode_cursor(message["created_time"], message["id"])
+    return encode_cursor(message.created_time, message.id)
+
+
+def paginate_room_messages(queryset, before=None, after=None, limit=None):
+    """
+    Keyset pagination over (room, created_time, id), served by room_message_keyset_idx.
+    Works with model instances as well as .values() rows.
+    Without a cursor, or with `before`, returns the page ending just before the cursor (latest page by default);
+    with `after`, returns the page starting just after the cursor. Results are always in chronological order.
+    """
+    page_size = get_page_size(limit)
+
+    if after:
+        created_time, message_id = decode_cursor(after)
+        queryset = queryset.filter(
+            Q(created_time__gt=created_time) | Q(created_time=created_time, id__gt=message_id)
+        ).order_by("created_time", "id")
+    else:
+        if before:
+            created_time, message_id = decode_cursor(before)
+            queryset = queryset.filter(
+                Q(created_time__lt=created_time) | Q(created_time=created_time, id__lt=message_id)
+            )
+        queryset = queryset.order_by("-created_time", "-id")
+
+    messages = list(queryset[:page_size + 1])
+    has_more = len(messages) > page_size
+    messages = messages[:page_size]
+    if not after:
+        messages.reverse()
+
+    previous_cursor = next_cursor = None
+    if messages:
+        first, last = messages[0], messages[-1]
+        # older messages exist if we paged forward, or paged backward and saw one extra row
+        if after or has_more:
+            previous_cursor = _cursor_of(first)
+        # newer messages exist if we paged backward from a cursor, or paged forward and saw one extra row
+        if before or (after and has_more):
+            next_cursor = _cursor_of(last)
+
+    return messages, previous_cursor, next_cursor
@@ -0,0 +1,96 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .models import Post, PostCategory, Tag
+from .tasks import fan_out_posts
+
+
+MAX_POST_TAGS = 5
+PostTag = Post.tags.through
+
+
+def clean_tag_names(tag_names):
+    """strip and de-duplicate keeping order, the tag limit is checked on the incoming list without any query"""
+    names = list(dict.fromkeys(name.strip() for name in tag_names or () if name and name.strip()))
+    if len(names) > MAX_POST_TAGS:
+        raise ValidationError(f"You cannot add more than {MAX_POST_TAGS} tags to post")
+    return names
+
+
+def resolve_tags(tag_names):
+    """tag name -> id, creating the missing ones: one INSERT ... ON CONFLICT DO NOTHING and one IN query"""
+    if not tag_names:
+        return {}
+    Tag.objects.bulk_create([Tag(tag_name=tag_name) for tag_name in tag_names], ignore_conflicts=True)
+    return dict(Tag.objects.filter(tag_name__in=tag_names).values_list("tag_name", "id"))
+
+
+def check_categories(category_ids):
+    found_ids = set(PostCategory.objects.filter(id__in=category_ids).values_list("id", flat=True))
+    missing_ids = set(category_ids) - found_ids
+    if missing_ids:
+        raise ValidationError(f"Unknown category: {', '.join(sorted(map(str, missing_ids)))}")
+
+
+def clean_post_fields(post):
+    # field-level checks only, FK existence is checked for the whole batch and uniqueness is left to the database
+    post.full_clean(exclude={"id", "author", "category"}, validate_unique=False, validate_constraints=False)
+
+
+def create_posts(author_id, items):
+    """
+    Create posts from [{"title", "content", "category", "tags"}]. The whole batch is validated in memory first,
+    then the number of queries doesn't depend on the number of posts or tags: categories, tag insert, tag lookup,
+    post insert and through-row insert (split into batch_size chunks for large imports).
+    """
+    tag_lists = [clean_tag_names(item.get("tags")) for item in items]
+    posts = [
+        Post(author_id=author_id, title=item["title"], content=item["content"], category_id=item["category"])
+        for item in items
+    ]
+    for post in posts:
+        clean_post_fields(post)
+
+    with transaction.atomic():
+        check_categories({post.category_id for post in posts})
+        tag_ids = resolve_tags(list(dict.fromkeys(name for tag_names in tag_lists for name in tag_names)))
+        Post.objects.bulk_create(posts, batch_size=1000)
+        PostTag.objects.bulk_create(
+            [
+                PostTag(post_id=post.id, tag_id=tag_ids[name])
+                for post, tag_names in zip(posts, tag_lists)
+                for name in tag_names
+            ],
+            batch_size=1000,
+        )
+        # bulk_create sends no post_save, the timelines are fed from here
+        post_ids = [str(post.id) for post in posts]
+        transaction.on_commit(lambda: fan_out_posts.delay(post_ids))
+    return posts
+
+
+def create_post(author_id, title, content, category, tags=None):
+    return create_posts(author_id, [{"title": title, "content": content, "category": category, "tags": tags}])[0]
+
+
+def update_post(post, title=None, content=None, category=None, tags=None):
+    """update the given fields, tags (when given) replace the current ones with a diff of the through rows"""
+    tag_names = clean_tag_names(tags) if tags is not None else None
+    update_fields = []
+    for field_name, value in (("title", title), ("content", content), ("category_id", category)):
+        if value is not None:
+            setattr(post, field_name, value)
+            update_fields.append(field_name)
+    clean_post_fields(post)
+
+    with transaction.atomic():
+        if category is not None:
+            check_categories({category})
+        if update_fields:
+            post.save(update_fields=[*update_fields, "updated_time"])
+        if tag_names is not None:
+            tag_ids = resolve_tags(tag_names)
+            PostTag.objects.filter(post_id=post.id).exclude(tag_id__in=tag_ids.values()).delete()
+            PostTag.objects.bulk_create(
+                [PostTag(post_id=post.id, tag_id=tag_id) for tag_id in tag_ids.values()], ignore_conflicts=True,
+            )
+    return post
@@ -0,0 +1,104 @@
+from time import time
+from django.conf import settings
+
+
+class LocalPresence:
+    """in-process presence, used when no Redis is configured (development, InMemoryChannelLayer)"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._rooms = {}  # room name -> username -> channel name -> last heartbeat
+
+    def _prune(self, connections):
+        oldest = time() - self.ttl
+        for channel_name in [channel_name for channel_name, last_seen in connections.items() if last_seen < oldest]:
+            del connections[channel_name]
+
+    async def touch(self, room_name, username, channel_name):
+        self._rooms.setdefault(room_name, {}).setdefault(username, {})[channel_name] = time()
+
+    async def leave(self, room_name, username, channel_name):
+        """forget one connection, True when it was the user's last one in the room"""
+        room = self._rooms.get(room_name, {})
+        connections = room.get(username, {})
+        connections.pop(channel_name, None)
+        self._prune(connections)
+        if connections:
+            return False
+        room.pop(username, None)
+        if not room:
+            self._rooms.pop(room_name, None)
+        return True
+
+    async def online(self, room_name):
+        room = self._rooms.get(room_name, {})
+        for username, connections in list(room.items()):
+            self._prune(connections)
+            if not connections:
+                del room[username]
+        return list(room)
+
+
+class RedisPresence:
+    """
+    Presence shared by all processes: one sorted set per room, member=username, score=last heartbeat, and one per
+    user in the room, member=channel name, so a user with several tabs stays online until the last one leaves.
+    Members whose heartbeat is older than ttl are pruned on read, so crashed connections expire on their own.
+    """
+
+    def __init__(self, url, ttl):
+        from redis import asyncio as redis
+
+        self.ttl = ttl
+        self.redis = redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def get_key(room_name):
+        return f"presence:{room_name}"
+
+    @classmethod
+    def get_connections_key(cls, room_name, username):
+        return f"{cls.get_key(room_name)}:{username}"
+
+    async def touch(self, room_name, username, channel_name):
+        key = self.get_key(room_name)
+        connections_key = self.get_connections_key(room_name, username)
+        now = time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(key, {username: now})
+            pipe.expire(key, int(self.ttl * 2))
+            pipe.zadd(connections_key, {channel_name: now})
+            pipe.expire(connections_key, int(self.ttl * 2))
+            await pipe.execute()
+
+    async def leave(self, room_name, username, channel_name):
+        """forget one connection, True when it was the user's last one in the room"""
+        connections_key = self.get_connections_key(room_name, username)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(connections_key, channel_name)
+            pipe.zremrangebyscore(connections_key, "-inf", time() - self.ttl)
+            pipe.zcard(connections_key)
+            removed, pruned, remaining = await pipe.execute()
+        if remaining:
+            return False
+        # a tab opened in between is listed again by its next heartbeat
+        await self.redis.zrem(self.get_key(room_name), username)
+        return True
+
+    async def online(self, room_name):
+        key = self.get_key(room_name)
+        oldest = time() - self.ttl
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(key, "-inf", oldest)
+            pipe.zrange(key, 0, -1)
+            pruned, usernames = await pipe.execute()
+        return usernames
+
+
+def get_presence():
+    if settings.PRESENCE_REDIS_URL:
+        return RedisPresence(settings.PRESENCE_REDIS_URL, ttl=settings.PRESENCE_TTL)
+    return LocalPresence(ttl=settings.PRESENCE_TTL)
+
+
+presence = get_presence()
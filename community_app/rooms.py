@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from threading import Lock
+from channels.db import database_sync_to_async
+from django.conf import settings
+from .models import Room
+
+
+class RoomIdCache:
+    """process-local LRU of room name -> Room id, invalidated by community_app.signals"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._rooms = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, room_name):
+        with self._lock:
+            room_id = self._rooms.get(room_name)
+            if room_id is not None:
+                self._rooms.move_to_end(room_name)
+            return room_id
+
+    def set(self, room_name, room_id):
+        with self._lock:
+            self._rooms[room_name] = room_id
+            self._rooms.move_to_end(room_name)
+            while len(self._rooms) > self.maxsize:
+                self._rooms.popitem(last=False)
+
+    def invalidate(self, room_name=None, room_id=None):
+        with self._lock:
+            if room_name is not None:
+                self._rooms.pop(room_name, None)
+            if room_id is not None:
+                for name in [name for name, cached_id in self._rooms.items() if cached_id == room_id]:
+                    del self._rooms[name]
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+room_id_cache = RoomIdCache(maxsize=settings.ROOM_ID_CACHE_SIZE)
+
+
+async def get_or_create_room_id(room_name, room_type):
+    room_id = room_id_cache.get(room_name)
+    if room_id is None:
+        # get_or_create retries the lookup on IntegrityError, so concurrent connects settle on one row
+        room, created = await database_sync_to_async(Room.objects.get_or_create)(
+            name=room_name,
+            defaults={"room_type": room_type},
+        )
+        room_id = room.id
+        room_id_cache.set(room_name, room_id)
+    return room_id
@@ -1,5 +1,14 @@
-from rest_framework.serializers import ModelSerializer, SerializerMethodField
-from .models import Room, RoomMessage
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import F
+from rest_framework.serializers import (
+    CharField, DateTimeField, ListField, ModelSerializer, Serializer, SerializerMethodField, SlugRelatedField, UUIDField,
+)
+from .models import Post, Room, RoomMessage
+
+
+# reused by the bulk fast path so timestamps render exactly like the DRF field
+datetime_field = DateTimeField()
 
 
 class RoomSerializer(ModelSerializer):
@@ -20,10 +29,93 @@ class RoomMessageSerializer(ModelSerializer):
 
     @staticmethod
     def get_room(obj):
-        """return user profession name"""
+        """return room name"""
         return obj.room.name
 
     @staticmethod
     def get_user(obj):
-        """return user profession name"""
+        """return username"""
         return obj.user.username
+
+    @staticmethod
+    def with_related(queryset):
+        """select_related variant for the regular serializer, avoids two extra queries per message"""
+        return queryset.select_related("room", "user").only(
+            "id", "room__name", "user__username", "text_message", "media_message", "created_time", "updated_time",
+        )
+
+    @staticmethod
+    def as_values(queryset):
+        """values() projection for the bulk fast path, one query and no model instances"""
+        return queryset.values(
+            "id", "text_message", "media_message", "created_time", "updated_time",
+            room_name=F("room__name"), username=F("user__username"),
+        )
+
+    @classmethod
+    def serialize_many(cls, rows):
+        """build the same payload as RoomMessageSerializer(many=True).data from values() rows"""
+        to_datetime = datetime_field.to_representation
+        return [
+            {
+                "room": row["room_name"],
+                "user": row["username"],
+                "text_message": row["text_message"],
+                "media_message": default_storage.url(row["media_message"]) if row["media_message"] else None,
+                "created_time": to_datetime(row["created_time"]),
+                "updated_time": to_datetime(row["updated_time"]),
+            }
+            for row in rows
+        ]
+
+
+class PostSerializer(ModelSerializer):
+    author = CharField(source="author.username", read_only=True)
+    category = CharField(source="category.category_name", read_only=True)
+    tags = SlugRelatedField(many=True, read_only=True, slug_field="tag_name")
+    likes_count = SerializerMethodField(read_only=True)
+    liked_by_me = SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = Post
+        fields = [
+            "id", "title", "content", "author", "category", "tags", "likes_count", "liked_by_me",
+            "created_time", "updated_time",
+        ]
+
+    def get_likes_count(self, obj):
+        """stored counter plus the likes still buffered, context from community_app.likes.get_like_context"""
+        return obj.likes_count + self.context.get("pending_likes", {}).get(obj.id, 0)
+
+    def get_liked_by_me(self, obj):
+        liked_ids = self.context.get("liked_ids")
+        return None if liked_ids is None else obj.id in liked_ids
+
+    @staticmethod
+    def with_related(queryset):
+        """author, category and tags in two queries for the whole page"""
+        return queryset.select_related("author", "category").prefetch_related("tags")
+
+
+class LikeLookupSerializer(Serializer):
+    ids = ListField(child=UUIDField(), allow_empty=False, max_length=settings.LIKES_LOOKUP_MAX_IDS)
+
+
+class PostWriteSerializer(Serializer):
+    """input of community_app.posts, checked in memory: the category is resolved once for a whole batch"""
+    title = CharField(max_length=100)
+    content = CharField()
+    category = UUIDField()
+    # no max_length: the tag limit is checked by clean_tag_names once duplicates are dropped
+    tags = ListField(child=CharField(max_length=100), required=False, default=list)
+
+
+class PostUpdateSerializer(PostWriteSerializer):
+    title = CharField(max_length=100, required=False)
+    content = CharField(required=False)
+    category = UUIDField(required=False)
+    tags = ListField(child=CharField(max_length=100), required=False)
+
+
+class PostBulkSerializer(Serializer):
+    posts = PostWriteSerializer(many=True, allow_empty=False, max_length=settings.POST_BULK_MAX_SIZE)
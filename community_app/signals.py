@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from shared_app.content_store import release_content
+from shared_app.tasks import generate_image_variants_task, needs_image_variants
+from .models import Post, PostComment, Room, RoomMessage
+from .rooms import room_id_cache
+from .tasks import fan_out_post
+
+
+@receiver(post_save, sender=Room)
+def invalidate_room_id_on_save(sender, instance, created, **kwargs):
+    if not created:
+        # the name may have changed, drop whatever name pointed at this room
+        room_id_cache.invalidate(room_name=instance.name, room_id=instance.id)
+
+
+@receiver(post_delete, sender=Room)
+def invalidate_room_id_on_delete(sender, instance, **kwargs):
+    room_id_cache.invalidate(room_name=instance.name, room_id=instance.id)
+
+
+@receiver(post_save, sender=PostComment)
+def generate_comment_image_variants(sender, instance, created, **kwargs):
+    if needs_image_variants(instance, "image"):
+        comment_id = instance.id
+        transaction.on_commit(
+            lambda: generate_image_variants_task.delay("community_app.PostComment", comment_id, ["image"])
+        )
+
+
+@receiver(post_delete, sender=RoomMessage)
+def release_media_message(sender, instance, **kwargs):
+    if instance.media_message:
+        release_content(instance.media_message.name)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        post_id = instance.id
+        transaction.on_commit(lambda: fan_out_post.delay(post_id))
@@ -0,0 +1,51 @@
+from django.conf import settings
+from config.celery import app
+from users_app.follows import to_score
+from users_app.models import CustomUser, Follow
+from .likes import like_counters
+from .models import Post
+from .timelines import timelines
+
+
+@app.task(ignore_result=True)
+def fan_out_post(post_id):
+    fan_out_posts([post_id])
+
+
+@app.task(ignore_result=True)
+def fan_out_posts(post_ids):
+    """
+    Push new posts into their author's and every follower's timeline, celebrities are merged at read time instead.
+    Followers are streamed once per author, a bulk import costs one pass over them.
+    """
+    if not timelines.fan_out:
+        return
+    post_scores_by_author = {}
+    for post_id, author_id, created_time in Post.objects.filter(id__in=post_ids).values_list(
+        "id", "author_id", "created_time"
+    ):
+        post_scores_by_author.setdefault(author_id, {})[str(post_id)] = to_score(created_time)
+
+    chunk_size = settings.TIMELINE_FAN_OUT_CHUNK_SIZE
+    for author_id, post_scores in post_scores_by_author.items():
+        timelines.push([author_id], post_scores)
+        followers_count = CustomUser.objects.values_list("followers_count", flat=True).get(id=author_id)
+        if followers_count >= settings.TIMELINE_CELEBRITY_FOLLOWERS:
+            continue
+
+        follower_ids = Follow.objects.filter(following_id=author_id).values_list("follower_id", flat=True)
+        chunk = []
+        for follower_id in follower_ids.iterator(chunk_size=chunk_size):
+            chunk.append(follower_id)
+            if len(chunk) >= chunk_size:
+                timelines.push(chunk, post_scores)
+                chunk = []
+        if chunk:
+            timelines.push(chunk, post_scores)
+
+
+@app.task(ignore_result=True)
+def flush_like_counts():
+    flushed = like_counters.flush()
+    if flushed:
+        print(f"❤️ like counters flushed for {flushed} posts and comments")
@@ -1,3 +1,401 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import datetime, timezone
+from unittest import mock, skipIf
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from users_app.models import CustomUser, Follow
+from .likes import RedisLikeCounters, like, unlike
+from .models import LikeFlush, Post, PostCategory, PostLike, Room, RoomMessage, Tag
+from .pagination import InvalidCursor, encode_cursor, paginate_room_messages
+from .posts import MAX_POST_TAGS, PostTag, create_posts, update_post
+from .presence import LocalPresence, RedisPresence
+from .routing import websocket_urlpatterns
+from .timelines import RedisTimelines, get_home_timeline, parse_cursor
+from .write_buffer import WriteBehindBuffer, release_dropped_message
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class PresenceTests(SimpleTestCase):
+    async def assertLastTabLeaves(self, presence):
+        await presence.touch("room", "alice", "tab-1")
+        await presence.touch("room", "alice", "tab-2")
+        await presence.touch("room", "bob", "tab-3")
+        self.assertFalse(await presence.leave("room", "alice", "tab-1"))
+        self.assertCountEqual(await presence.online("room"), ["alice", "bob"])
+        self.assertTrue(await presence.leave("room", "alice", "tab-2"))
+        self.assertEqual(await presence.online("room"), ["bob"])
+
+    def test_local_user_stays_online_until_last_connection_leaves(self):
+        asyncio.run(self.assertLastTabLeaves(LocalPresence(ttl=60)))
+
+    @skipIf(fakeredis is None, "fakeredis is not installed")
+    def test_redis_user_stays_online_until_last_connection_leaves(self):
+        async def run():
+            presence = RedisPresence("redis://localhost:6379", ttl=60)
+            presence.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+            await self.assertLastTabLeaves(presence)
+
+        asyncio.run(run())
+
+
+def create_post():
+    # bulk_create sends no post_save, so no task is queued on commit
+    [author] = CustomUser.objects.bulk_create([CustomUser(username="author")])
+    [category] = PostCategory.objects.bulk_create([PostCategory(category_name="category")])
+    [post] = Post.objects.bulk_create([Post(title="post", content="content", author=author, category=category)])
+    return post
+
+
+class RoomMessagePaginationTests(TestCase):
+    def setUp(self):
+        [user] = CustomUser.objects.bulk_create([CustomUser(username="sender")])
+        [room] = Room.objects.bulk_create([Room(name="room")])
+        RoomMessage.objects.bulk_create([
+            RoomMessage(room=room, user=user, text_message=str(number)) for number in range(7)
+        ])
+        # the first five share one created_time, only the id orders them
+        same_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        first_ids = RoomMessage.objects.order_by("text_message").values_list("id", flat=True)[:5]
+        RoomMessage.objects.filter(id__in=list(first_ids)).update(created_time=same_time)
+        self.messages = RoomMessage.objects.filter(room=room)
+        self.ids = list(self.messages.order_by("created_time", "id").values_list("id", flat=True))
+
+    def test_backward_walk_returns_every_message_once(self):
+        ids, before = [], None
+        while True:
+            page, previous_cursor, next_cursor = paginate_room_messages(self.messages, before=before, limit=2)
+            ids = [message.id for message in page] + ids
+            if previous_cursor is None:
+                break
+            before = previous_cursor
+        self.assertEqual(ids, self.ids)
+
+    def test_forward_walk_returns_every_message_once(self):
+        first = self.messages.get(id=self.ids[0])
+        ids, after = [first.id], encode_cursor(first.created_time, first.id)
+        while after:
+            page, previous_cursor, after = paginate_room_messages(self.messages, after=after, limit=2)
+            ids += [message.id for message in page]
+        self.assertEqual(ids, self.ids)
+
+    def test_invalid_cursor_and_limit(self):
+        with self.assertRaises(InvalidCursor):
+            paginate_room_messages(self.messages, before="not a cursor")
+        with self.assertRaises(InvalidCursor):
+            paginate_room_messages(self.messages, limit="ten")
+
+
+class WriteBehindBufferTests(SimpleTestCase):
+    def make_buffer(self, write):
+        return WriteBehindBuffer(write, max_batch_size=10, flush_interval=0.01, max_pending=100, retry_delay=0)
+
+    def test_failed_batch_is_retried(self):
+        written, failures = [], [Exception("database is gone")]
+
+        def write(rows):
+            if failures:
+                raise failures.pop()
+            written.extend(rows)
+
+        async def run():
+            buffer = self.make_buffer(write)
+            for row in range(3):
+                await buffer.put(row)
+            await buffer.close()
+
+        asyncio.run(run())
+        self.assertEqual(written, [0, 1, 2])
+
+    def test_bad_row_only_drops_itself(self):
+        written = []
+
+        def write(rows):
+            if 1 in rows:
+                raise ValueError("bad row")
+            written.extend(rows)
+
+        async def run():
+            buffer = self.make_buffer(write)
+            for row in range(3):
+                await buffer.put(row)
+            await buffer.close()
+
+        asyncio.run(run())
+        self.assertEqual(written, [0, 2])
+
+    def test_dropped_rows_are_handed_to_on_drop(self):
+        dropped = []
+
+        def write(rows):
+            if 1 in rows:
+                raise ValueError("bad row")
+
+        async def run():
+            buffer = WriteBehindBuffer(
+                write, max_batch_size=10, flush_interval=0.01, max_pending=100, retry_delay=0, on_drop=dropped.append,
+            )
+            for row in range(3):
+                await buffer.put(row)
+            await buffer.close()
+
+        asyncio.run(run())
+        self.assertEqual(dropped, [1])
+
+    def test_dropped_media_message_releases_its_content(self):
+        with mock.patch("community_app.write_buffer.release_content") as release_content:
+            release_dropped_message(RoomMessage(text_message="text"))
+            release_content.assert_not_called()
+            release_dropped_message(RoomMessage(media_message="content/ab/abcd.png"))
+        release_content.assert_called_once_with("content/ab/abcd.png")
+
+    def test_drain_writes_queued_rows_without_event_loop(self):
+        written = []
+        buffer = self.make_buffer(written.extend)
+
+        async def put():
+            buffer._queue = asyncio.Queue()
+            for row in range(25):
+                buffer._queue.put_nowait(row)
+
+        asyncio.run(put())
+        buffer.drain()
+        self.assertEqual(written, list(range(25)))
+
+
+class LikeTests(TransactionTestCase):
+    # like() settles a duplicate with the IntegrityError of its INSERT, which would break TestCase's transaction
+    def setUp(self):
+        self.post = create_post()
+        self.user = self.post.author
+
+    async def test_like_and_unlike_are_idempotent(self):
+        self.assertTrue(await like("post", self.post.id, self.user.id))
+        self.assertFalse(await like("post", self.post.id, self.user.id))
+        self.assertEqual(await PostLike.objects.filter(post=self.post).acount(), 1)
+        await self.post.arefresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        self.assertTrue(await unlike("post", self.post.id, self.user.id))
+        self.assertFalse(await unlike("post", self.post.id, self.user.id))
+        await self.post.arefresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class RedisLikeCountersTests(TestCase):
+    def setUp(self):
+        self.post = create_post()
+        self.counters = RedisLikeCounters("redis://localhost:6379")
+        self.counters.redis = fakeredis.FakeRedis(decode_responses=True)
+
+    def test_flush_applies_pending_deltas(self):
+        self.counters.redis.hincrby(self.counters.get_key("post"), str(self.post.id), 3)
+        self.assertEqual(self.counters.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 3)
+        self.assertFalse(self.counters.redis.exists("likes:pending:post", "likes:pending:post:flushing"))
+
+    def test_batch_committed_before_a_crash_is_not_applied_twice(self):
+        self.counters.redis.hincrby(self.counters.get_key("post"), str(self.post.id), 2)
+        delete = self.counters.redis.delete
+
+        def crash_on_batch_delete(*keys):
+            if keys[0].endswith(":flushing"):
+                raise ConnectionError("worker died")
+            return delete(*keys)
+
+        with mock.patch.object(self.counters.redis, "delete", side_effect=crash_on_batch_delete):
+            with self.assertRaises(ConnectionError):
+                self.counters.flush()
+        self.assertTrue(self.counters.redis.exists("likes:pending:post:flushing"))
+
+        self.counters.redis.hincrby(self.counters.get_key("post"), str(self.post.id), 1)
+        self.counters.flush()  # drops the leftover batch, the new like is applied by the next flush
+        self.counters.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 3)
+        self.assertEqual(LikeFlush.objects.count(), 2)
+
+    def test_flush_skips_while_another_holds_the_lock(self):
+        self.counters.redis.hincrby(self.counters.get_key("post"), str(self.post.id), 1)
+        self.counters.redis.set("likes:flush:lock", "another worker")
+        self.assertEqual(self.counters.flush(), 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+
+class HomeTimelineTests(TestCase):
+    def setUp(self):
+        post = create_post()
+        [self.user] = CustomUser.objects.bulk_create([CustomUser(username="reader")])
+        Follow.objects.bulk_create([Follow(follower=self.user, following=post.author)])
+        # a bulk import: every post shares one created_time
+        Post.objects.bulk_create([
+            Post(title=f"post {number}", content="content", author=post.author, category=post.category)
+            for number in range(6)
+        ])
+        Post.objects.update(created_time=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.post_ids = sorted(Post.objects.values_list("id", flat=True), reverse=True)
+
+    async def walk(self, limit=2):
+        post_ids, cursor = [], None
+        while True:
+            page_ids, cursor = await get_home_timeline(self.user.id, parse_cursor(cursor), limit)
+            post_ids += page_ids
+            if cursor is None:
+                return post_ids
+
+    async def test_database_timeline_walks_posts_with_the_same_time(self):
+        self.assertEqual(await self.walk(), self.post_ids)
+
+    async def test_redis_timeline_walks_posts_with_the_same_score(self):
+        if fakeredis is None:
+            self.skipTest("fakeredis is not installed")
+        redis_timelines = RedisTimelines("redis://localhost:6379", ttl=60, max_length=100)
+        redis_timelines.aredis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        with mock.patch("community_app.timelines.timelines", redis_timelines):
+            self.assertEqual(await self.walk(), self.post_ids)
+
+
+class PostWriteTests(TestCase):
+    def setUp(self):
+        [self.author] = CustomUser.objects.bulk_create([CustomUser(username="author")])
+        [self.category] = PostCategory.objects.bulk_create([PostCategory(category_name="category")])
+
+    def item(self, number=0, **fields):
+        return {"title": f"post {number}", "content": "content", "category": self.category.id, **fields}
+
+    def tag_names(self, post):
+        return list(post.tags.order_by("tag_name").values_list("tag_name", flat=True))
+
+    def test_tags_are_deduplicated_before_the_limit(self):
+        tags = [" django", "django ", "python", "", *(f"tag {number}" for number in range(MAX_POST_TAGS - 2)), "python"]
+        [post] = create_posts(self.author.id, [self.item(tags=tags)])
+        self.assertEqual(self.tag_names(post), ["django", "python", "tag 0", "tag 1", "tag 2"])
+
+        with self.assertRaises(ValidationError):
+            create_posts(self.author.id, [self.item(tags=[f"tag {number}" for number in range(MAX_POST_TAGS + 1)])])
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_unknown_category_writes_nothing(self):
+        items = [self.item(0, tags=["django"]), self.item(1, category="00000000-0000-0000-0000-000000000000")]
+        with self.assertRaisesMessage(ValidationError, "Unknown category"):
+            create_posts(self.author.id, items)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+
+    def test_update_replaces_tags_with_a_diff(self):
+        [post] = create_posts(self.author.id, [self.item(tags=["a", "b", "c"])])
+        kept_row_ids = set(PostTag.objects.filter(post=post, tag__tag_name__in=["b", "c"]).values_list("id", flat=True))
+
+        update_post(post, title="updated", tags=["b", "c", "d", "b"])
+        post.refresh_from_db()
+        self.assertEqual(post.title, "updated")
+        self.assertEqual(self.tag_names(post), ["b", "c", "d"])
+        self.assertTrue(kept_row_ids <= set(PostTag.objects.filter(post=post).values_list("id", flat=True)))
+
+        update_post(post, content="content 2")
+        self.assertEqual(self.tag_names(post), ["b", "c", "d"])
+
+    def test_bulk_import_query_count_does_not_grow(self):
+        def count_queries(size):
+            items = [self.item(number, tags=[f"tag {number % 3}", "shared"]) for number in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                create_posts(self.author.id, items)
+            return len(queries)
+
+        self.assertEqual(count_queries(2), count_queries(50))
+        self.assertEqual(Post.objects.count(), 52)
+        self.assertEqual(PostTag.objects.count(), 104)
+
+    def test_bulk_endpoint(self):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {self.author.get_user_tokens()['access_token']}"}
+        posts = [self.item(number, category=str(self.category.id), tags=["django"] * 7) for number in range(3)]
+        response = self.client.post(
+            "/api/v1/community/posts/bulk/", {"posts": posts}, content_type="application/json", **headers,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 3)
+        self.assertEqual(PostTag.objects.count(), 3)
+
+        posts.append(self.item(3, category="00000000-0000-0000-0000-000000000000"))
+        response = self.client.post(
+            "/api/v1/community/posts/bulk/", {"posts": posts}, content_type="application/json", **headers,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Post.objects.count(), 3)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    CHAT_MEDIA_MAX_SIZE=10,
+)
+class ChatMediaUploadTests(TransactionTestCase):
+    # the consumer reaches the database from its own thread, TestCase's transaction would not be shared
+    def setUp(self):
+        [self.user] = CustomUser.objects.bulk_create([CustomUser(username="uploader")])
+        for patcher in (
+            mock.patch("community_app.consumers.message_buffer", put=mock.AsyncMock()),
+            mock.patch("community_app.consumers.room_member_buffer", put=mock.AsyncMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.store_upload_media = self.patch_async("community_app.consumers.store_upload_media", ("upload", "/upload"))
+        self.store_single_frame_media = self.patch_async(
+            "community_app.consumers.store_single_frame_media", ("frame", "/frame"),
+        )
+
+    def patch_async(self, target, return_value):
+        patcher = mock.patch(target, new=mock.AsyncMock(return_value=return_value))
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/chat/uploads/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(json.loads(await communicator.receive_from())["type"], "join")
+        return communicator
+
+    async def send_media_start(self, communicator, size):
+        await communicator.send_to(text_data=json.dumps({"type": "media_start", "filename": "a.png", "size": size}))
+
+    async def test_chunks_of_a_rejected_upload_are_dropped(self):
+        communicator = await self.connect()
+        await self.send_media_start(communicator, 100)
+        self.assertEqual(json.loads(await communicator.receive_from())["type"], "error")
+        await communicator.send_to(bytes_data=b"chunk")
+        self.assertTrue(await communicator.receive_nothing())
+        self.store_single_frame_media.assert_not_called()
+
+        await self.send_media_start(communicator, 3)
+        await communicator.send_to(bytes_data=b"abc")
+        self.assertEqual(json.loads(await communicator.receive_from())["media_key"], "upload")
+        await communicator.disconnect()
+
+    async def test_chunks_after_an_aborted_upload_are_dropped(self):
+        communicator = await self.connect()
+        await self.send_media_start(communicator, 2)
+        await communicator.send_to(bytes_data=b"abc")
+        self.assertEqual(json.loads(await communicator.receive_from())["type"], "error")
+        await communicator.send_to(bytes_data=b"d")
+        self.assertTrue(await communicator.receive_nothing())
+        self.store_single_frame_media.assert_not_called()
+        self.store_upload_media.assert_not_called()
+        await communicator.disconnect()
+
+    async def test_single_frame_media_without_media_start(self):
+        communicator = await self.connect()
+        await communicator.send_to(bytes_data=b"abc")
+        self.assertEqual(json.loads(await communicator.receive_from())["media_key"], "frame")
+        await communicator.disconnect()
@@ -0,0 +1,160 @@
+from uuid import UUID
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from users_app.follows import format_cursor, from_score, to_score
+from users_app.models import Follow
+from .models import Post
+
+
+class InvalidFeedCursor(Exception):
+    pass
+
+
+def parse_cursor(cursor):
+    """"{score}_{post id}" -> (score, post id), the post id breaks ties between posts of the same microsecond"""
+    if cursor in (None, ""):
+        return None
+    try:
+        score, post_id = cursor.split("_", 1)
+        return int(score), UUID(post_id)
+    except ValueError as e:
+        raise InvalidFeedCursor(f"Invalid cursor: {cursor}") from e
+
+
+def get_page_size(limit):
+    if limit is None:
+        return settings.FEED_PAGE_SIZE
+    try:
+        return max(1, min(int(limit), settings.FEED_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise InvalidFeedCursor(f"Invalid limit: {limit}")
+
+
+def followed_authors(user_id):
+    return Follow.objects.filter(follower_id=user_id).values("following_id")
+
+
+async def _post_rows(posts, cursor, count):
+    """(post id, score) newest first on the (created_time, id) keyset, served by post_author_time_idx"""
+    if cursor is not None:
+        score, post_id = cursor
+        created_time = from_score(score)
+        posts = posts.filter(Q(created_time__lt=created_time) | Q(created_time=created_time, id__lt=post_id))
+    rows = posts.order_by("-created_time", "-id").values_list("id", "created_time")[:count]
+    return [(post_id, to_score(created_time)) async for post_id, created_time in rows]
+
+
+class DatabaseTimelines:
+    """fan-out-on-read for everyone, used when no Redis is configured"""
+    fan_out = False
+
+    async def page(self, user_id, cursor, count):
+        posts = Post.objects.filter(Q(author_id=user_id) | Q(author_id__in=followed_authors(user_id)))
+        return await _post_rows(posts, cursor, count)
+
+    def push(self, user_ids, post_scores):
+        pass
+
+
+class RedisTimelines:
+    """
+    Home timelines shared by all processes: timeline:{user id} sorted set, member=post id, score=publish time in
+    microseconds, equal scores ordered by member like the database orders by id, capped at TIMELINE_MAX_LENGTH newest posts. Celery workers push with the sync client, views read
+    with the async one. A missing timeline is rebuilt from the database once, {key}:loaded marks a complete one.
+    """
+    fan_out = True
+
+    def __init__(self, url, ttl, max_length):
+        import redis
+        from redis import asyncio as aredis
+
+        self.ttl = ttl
+        self.max_length = max_length
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.aredis = aredis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def get_key(user_id):
+        return f"timeline:{user_id}"
+
+    def push(self, user_ids, post_scores):
+        """
+        One pipeline for a chunk of followers: add {post id: score}, trim to the newest max_length,
+        expire idle timelines.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            key = self.get_key(user_id)
+            pipe.zadd(key, post_scores)
+            pipe.zremrangebyrank(key, 0, -self.max_length - 1)
+            pipe.expire(key, self.ttl, nx=True)
+        pipe.execute()
+
+    async def load(self, user_id):
+        key = self.get_key(user_id)
+        if await self.aredis.exists(f"{key}:loaded"):
+            return key
+
+        # rebuilt without the celebrity authors, their posts are merged at read time anyway
+        authors = followed_authors(user_id).filter(following__followers_count__lt=settings.TIMELINE_CELEBRITY_FOLLOWERS)
+        posts = Post.objects.filter(Q(author_id=user_id) | Q(author_id__in=authors))
+        rows = await _post_rows(posts, None, self.max_length)
+        async with self.aredis.pipeline(transaction=True) as pipe:
+            if rows:
+                pipe.zadd(key, {str(post_id): score for post_id, score in rows})
+                pipe.zremrangebyrank(key, 0, -self.max_length - 1)
+            pipe.expire(key, self.ttl)
+            pipe.set(f"{key}:loaded", 1, ex=self.ttl)
+            await pipe.execute()
+        return key
+
+    async def page(self, user_id, cursor, count):
+        key = await self.load(user_id)
+        if cursor is None:
+            rows = await self.aredis.zrevrangebyscore(key, "+inf", "-inf", start=0, num=count, withscores=True)
+        else:
+            # the posts sharing the cursor's score are read whole and filtered on the id, in the same round trip
+            score, post_id = cursor
+            async with self.aredis.pipeline(transaction=False) as pipe:
+                pipe.zrevrangebyscore(key, score, score, withscores=True)
+                pipe.zrevrangebyscore(key, f"({score}", "-inf", start=0, num=count, withscores=True)
+                ties, older = await pipe.execute()
+            rows = [(member, tie_score) for member, tie_score in ties if member < str(post_id)] + older
+        return [(UUID(member), int(score)) for member, score in rows[:count]]
+
+
+def get_timelines():
+    if settings.TIMELINE_REDIS_URL:
+        return RedisTimelines(
+            settings.TIMELINE_REDIS_URL, ttl=settings.TIMELINE_TTL, max_length=settings.TIMELINE_MAX_LENGTH,
+        )
+    return DatabaseTimelines()
+
+
+timelines = get_timelines()
+
+
+async def get_home_timeline(user_id, cursor=None, limit=None):
+    """
+    One page of the home timeline as ([post ids], next cursor). The pushed timeline is merged with the latest
+    posts of the followed celebrity authors, which are never fanned out. Both sources are read with a bounded
+    range, so the cost doesn't grow with the number of follows or posts.
+    """
+    rows = await timelines.page(user_id, cursor, limit + 1)
+    if timelines.fan_out:
+        celebrity_posts = Post.objects.filter(author_id__in=followed_authors(user_id).filter(
+            following__followers_count__gte=settings.TIMELINE_CELEBRITY_FOLLOWERS
+        ))
+        rows += await _post_rows(celebrity_posts, cursor, limit + 1)
+        # an author who crossed the threshold may show up in both sources
+        rows = sorted(dict(rows).items(), key=lambda row: (row[1], row[0]), reverse=True)
+
+    if len(rows) > limit:
+        return [post_id for post_id, score in rows[:limit]], format_cursor(rows[limit - 1])
+    return [post_id for post_id, score in rows], None
+
+
+def visible_posts(user_id, post_ids):
+    """posts of the page that still exist and whose author is still followed, unfollows are not fanned out"""
+    author_followed = Exists(Follow.objects.filter(follower_id=user_id, following_id=OuterRef("author_id")))
+    return Post.objects.filter(id__in=post_ids).filter(Q(author_id=user_id) | author_followed)
@@ -1,8 +1,20 @@
 from django.urls import path
-from .views import ChatRoomAPIView, GroupRoomAPIView
+from .views import (
+    ChatRoomAPIView, ChatRoomOnlineAPIView, GroupRoomAPIView, HomeFeedAPIView,
+    PostAPIView, PostBulkAPIView, PostDetailAPIView, LikeAPIView, LikeLookupAPIView,
+)
 
 
 urlpatterns = [
     path("chat/<str:chat_room_name>/", ChatRoomAPIView.as_view()),
+    path("chat/<str:chat_room_name>/online/", ChatRoomOnlineAPIView.as_view()),
     path("group/<str:group_room_name>/", GroupRoomAPIView.as_view()),
+    path("feed/", HomeFeedAPIView.as_view()),
+    path("posts/", PostAPIView.as_view()),
+    path("posts/bulk/", PostBulkAPIView.as_view()),
+    path("posts/<uuid:post_id>/", PostDetailAPIView.as_view()),
+    path("posts/<uuid:object_id>/like/", LikeAPIView.as_view(kind="post")),
+    path("posts/likes/", LikeLookupAPIView.as_view(kind="post")),
+    path("comments/<uuid:object_id>/like/", LikeAPIView.as_view(kind="comment")),
+    path("comments/likes/", LikeLookupAPIView.as_view(kind="comment")),
 ]
@@ -1,24 +1,166 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
 from adrf.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from .models import Room, RoomMessage
-from .serializers import RoomMessageSerializer
+from .models import Post, Room, RoomMessage
+from .pagination import InvalidCursor, paginate_room_messages
+from .presence import presence
+from .likes import LIKEABLE, get_like_context, like, unlike
+from .posts import create_post, create_posts, update_post
+from .serializers import (
+    LikeLookupSerializer, PostBulkSerializer, PostSerializer, PostUpdateSerializer, PostWriteSerializer,
+    RoomMessageSerializer,
+)
+from .timelines import InvalidFeedCursor, get_home_timeline, get_page_size, parse_cursor, visible_posts
 
 
 class ChatRoomAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def get(self, request):
+    def get(self, request, chat_room_name=None):
+        chat_room_name = chat_room_name or request.headers.get("chat-room-name")
         try:
-            chat_room_name = request.headers.get("chat-room-name")
             room = Room.objects.get(name=chat_room_name)
-            messages = RoomMessage.objects.filter(room=room).order_by("created_time")
-            serializer = RoomMessageSerializer(messages, many=True)
-            print(f"SERIALIZER.DATA: {serializer.data}\n CHAT_ROOM_NAME: {chat_room_name}")
-            return Response(serializer.data, status=status.HTTP_200_OK)
         except Room.DoesNotExist:
             return Response({"error": "Room not found"}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            messages, previous_cursor, next_cursor = paginate_room_messages(
+                RoomMessageSerializer.as_values(RoomMessage.objects.filter(room=room)),
+                before=request.query_params.get("before"),
+                after=request.query_params.get("after"),
+                limit=request.query_params.get("limit"),
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {"results": RoomMessageSerializer.serialize_many(messages), "previous": previous_cursor, "next": next_cursor},
+            status=status.HTTP_200_OK,
+        )
+
+
+class ChatRoomOnlineAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, chat_room_name):
+        online_users = await presence.online(chat_room_name)
+        return Response({"room": chat_room_name, "users": online_users}, status=status.HTTP_200_OK)
+
+
+class HomeFeedAPIView(APIView):
+    """posts of the followed users and the user's own, newest first, ?cursor=&limit="""
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        try:
+            cursor = parse_cursor(request.query_params.get("cursor"))
+            limit = get_page_size(request.query_params.get("limit"))
+        except InvalidFeedCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        post_ids, next_cursor = await get_home_timeline(request.user.id, cursor, limit)
+        posts = {post.id: post async for post in PostSerializer.with_related(visible_posts(request.user.id, post_ids))}
+        feed_serializer = PostSerializer(
+            [posts[post_id] for post_id in post_ids if post_id in posts],
+            many=True,
+            context=await get_like_context("post", request.user.id, list(posts)),
+        )
+        return Response({"results": await feed_serializer.adata, "next": next_cursor}, status=status.HTTP_200_OK)
+
+
+class PostAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        post_serializer = PostWriteSerializer(data=request.data)
+        post_serializer.is_valid(raise_exception=True)
+        try:
+            post = await sync_to_async(create_post)(request.user.id, **post_serializer.validated_data)
+        except DjangoValidationError as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        post = await PostSerializer.with_related(Post.objects.filter(id=post.id)).aget()
+        return Response(await PostSerializer(post).adata, status=status.HTTP_201_CREATED)
+
+
+class PostDetailAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def patch(self, request, post_id):
+        post = await Post.objects.filter(id=post_id, author_id=request.user.id).afirst()
+        if post is None:
+            return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        post_serializer = PostUpdateSerializer(data=request.data, partial=True)
+        post_serializer.is_valid(raise_exception=True)
+        try:
+            await sync_to_async(update_post)(post, **post_serializer.validated_data)
+        except DjangoValidationError as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        post = await PostSerializer.with_related(Post.objects.filter(id=post.id)).aget()
+        return Response(await PostSerializer(post).adata, status=status.HTTP_200_OK)
+
+
+class PostBulkAPIView(APIView):
+    """import many posts of the requesting user at once, {"posts": [{"title", "content", "category", "tags"}]}"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        bulk_serializer = PostBulkSerializer(data=request.data)
+        bulk_serializer.is_valid(raise_exception=True)
+        try:
+            posts = await sync_to_async(create_posts)(request.user.id, bulk_serializer.validated_data["posts"])
+        except DjangoValidationError as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"created": len(posts), "ids": [post.id for post in posts]}, status=status.HTTP_201_CREATED)
+
+
+class LikeAPIView(APIView):
+    """POST likes, DELETE unlikes, both idempotent. kind is "post" or "comment"."""
+    permission_classes = [permissions.IsAuthenticated]
+    kind = "post"
+
+    async def post(self, request, object_id):
+        model = LIKEABLE[self.kind][0]
+        try:
+            liked = await like(self.kind, object_id, request.user.id)
+        except model.DoesNotExist as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"liked": True}, status=status.HTTP_201_CREATED if liked else status.HTTP_200_OK)
+
+    async def delete(self, request, object_id):
+        await unlike(self.kind, object_id, request.user.id)
+        return Response({"liked": False}, status=status.HTTP_200_OK)
+
+
+class LikeLookupAPIView(APIView):
+    """like counts and liked-by-me of a page of ids, {"ids": [...]}: two queries and one Redis pipeline"""
+    permission_classes = [permissions.IsAuthenticated]
+    kind = "post"
+
+    async def post(self, request):
+        lookup_serializer = LikeLookupSerializer(data=request.data)
+        lookup_serializer.is_valid(raise_exception=True)
+        object_ids = lookup_serializer.validated_data["ids"]
+
+        model = LIKEABLE[self.kind][0]
+        stored_counts = {
+            object_id: likes_count
+            async for object_id, likes_count in model.objects.filter(id__in=object_ids).values_list("id", "likes_count")
+        }
+        like_context = await get_like_context(self.kind, request.user.id, list(stored_counts))
+        return Response(
+            {
+                str(object_id): {
+                    "likes_count": likes_count + like_context["pending_likes"].get(object_id, 0),
+                    "liked_by_me": object_id in like_context["liked_ids"],
+                }
+                for object_id, likes_count in stored_counts.items()
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 class GroupRoomAPIView(APIView):
     def get(self, request):
@@ -0,0 +1,167 @@
+import asyncio
+import atexit
+from channels.db import database_sync_to_async
+from django.conf import settings
+from shared_app.content_store import release_content
+from .models import Room, RoomMessage
+
+
+class WriteBehindBuffer:
+    """
+    Process-wide write-behind buffer.
+    Consumers put unsaved rows, a single background task hands them to write() (a sync callable, usually a
+    bulk_create) once max_batch_size rows are pending or flush_interval seconds passed since the first one.
+    put() waits while max_pending rows are queued, which pushes back on the senders.
+    A failing batch is retried max_attempts times, then written row by row so one bad row only loses itself,
+    on_drop(row) is called for every row given up on.
+    """
+
+    def __init__(
+        self, write, max_batch_size, flush_interval, max_pending, max_attempts=3, retry_delay=1, on_drop=None,
+    ):
+        self.write = write
+        self.on_drop = on_drop
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue = None
+        self._flusher = None
+        self._collecting = None  # rows taken off the queue and not handed to write() yet
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+
+    async def put(self, row):
+        self._ensure_started()
+        await self._queue.put(row)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._collecting = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._collecting = None
+            await self._write(batch)
+
+    def _write_rows(self, rows):
+        for row in rows:
+            try:
+                self.write([row])
+            except Exception as e:
+                print(f"🥶 dropped {row!r}: {e}")
+                self._drop(row)
+
+    def _drop(self, row):
+        if self.on_drop is None:
+            return
+        try:
+            self.on_drop(row)
+        except Exception as e:
+            print(f"🥶 error cleaning up dropped {row!r}: {e}")
+
+    async def _write(self, batch):
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    await database_sync_to_async(self.write)(batch)
+                    return
+                except Exception as e:
+                    print(f"🥶 error flushing {len(batch)} rows, attempt {attempt}/{self.max_attempts}: {e}")
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(self.retry_delay * attempt)
+            await database_sync_to_async(self._write_rows)(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def flush(self):
+        """wait until everything put so far is written"""
+        if self._queue is not None and not self._queue.empty():
+            self._ensure_started()
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        """flush pending rows and stop the background task, called on server shutdown"""
+        await self.flush()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+    def drain(self):
+        """
+        Write what is still queued from plain sync code once the event loop is gone. Registered with atexit:
+        Daphne sends no lifespan events, so close() only runs under servers that do (uvicorn).
+        """
+        if self._queue is None:
+            return
+        rows = self._collecting or []
+        self._collecting = None
+        while not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        for start in range(0, len(rows), self.max_batch_size):
+            batch = rows[start:start + self.max_batch_size]
+            try:
+                self.write(batch)
+            except Exception as e:
+                print(f"🥶 error flushing {len(batch)} rows on exit: {e}")
+                self._write_rows(batch)
+
+
+def write_room_messages(messages):
+    RoomMessage.objects.bulk_create(messages, batch_size=settings.CHAT_WRITE_BUFFER_BATCH_SIZE)
+
+
+def release_dropped_message(message):
+    # the media key was referenced when the upload was stored, a message that is never written gives it back
+    if message.media_message:
+        release_content(message.media_message.name)
+
+
+def write_room_members(memberships):
+    # the same user joining many times between flushes is collapsed here and by ignore_conflicts
+    unique_memberships = {(membership.room_id, membership.customuser_id): membership for membership in memberships}
+    Room.members.through.objects.bulk_create(unique_memberships.values(), ignore_conflicts=True)
+
+
+message_buffer = WriteBehindBuffer(
+    write=write_room_messages,
+    max_batch_size=settings.CHAT_WRITE_BUFFER_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_BUFFER_FLUSH_INTERVAL,
+    max_pending=settings.CHAT_WRITE_BUFFER_MAX_PENDING,
+    max_attempts=settings.CHAT_WRITE_BUFFER_MAX_ATTEMPTS,
+    retry_delay=settings.CHAT_WRITE_BUFFER_RETRY_DELAY,
+    on_drop=release_dropped_message,
+)
+
+room_member_buffer = WriteBehindBuffer(
+    write=write_room_members,
+    max_batch_size=settings.CHAT_WRITE_BUFFER_BATCH_SIZE,
+    flush_interval=settings.ROOM_MEMBERS_FLUSH_INTERVAL,
+    max_pending=settings.CHAT_WRITE_BUFFER_MAX_PENDING,
+    max_attempts=settings.CHAT_WRITE_BUFFER_MAX_ATTEMPTS,
+    retry_delay=settings.CHAT_WRITE_BUFFER_RETRY_DELAY,
+)
+
+
+@atexit.register
+def drain_buffers():
+    for buffer in (message_buffer, room_member_buffer):
+        buffer.drain()
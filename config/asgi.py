@@ -4,6 +4,7 @@ from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 
 from community_app.routing import websocket_urlpatterns
+from config.lifespan import LifespanApp
 from config.middleware import CustomTokenAuthMiddleWare
 
 
@@ -13,4 +14,5 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": CustomTokenAuthMiddleWare(AllowedHostsOriginValidator(URLRouter(websocket_urlpatterns))),
+    "lifespan": LifespanApp(),
 })
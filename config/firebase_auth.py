@@ -3,7 +3,12 @@ from firebase_admin import credentials, auth
 from pathlib import Path
 from environ import Env
 import asyncio
+import re
 from functools import partial
+from time import time
+import jwt
+import requests
+from cryptography.x509 import load_pem_x509_certificate
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -25,18 +30,118 @@ print(f"Firebase credentials path: {firebase_credentials_path}")
 firebase_credentials = credentials.Certificate(firebase_credentials_path)
 firebase_admin.initialize_app(firebase_credentials)
 
+FIREBASE_PROJECT_ID = env.str("FIREBASE_PROJECT_ID", default=firebase_credentials.project_id)
+FIREBASE_TOKEN_LEEWAY = env.int("FIREBASE_TOKEN_LEEWAY", default=10)  # seconds of clock skew
+# seconds the keys are kept when the response carries no max-age, Google rotates them every few days
+FIREBASE_KEYS_DEFAULT_MAX_AGE = env.int("FIREBASE_KEYS_DEFAULT_MAX_AGE", default=60 * 60)
+GOOGLE_PUBLIC_KEYS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
 
-async def custom_firebase_validation(firebase_id_token):
+
+def load_public_keys(certificates):
+    """kid -> x509 PEM into kid -> public key, parsed once per refresh instead of once per token"""
+    return {kid: load_pem_x509_certificate(pem.encode()).public_key() for kid, pem in certificates.items()}
+
+
+class StaticPublicKeys:
+    """fixed key source, e.g. keys of a locally generated certificate in offline tests"""
+
+    def __init__(self, certificates):
+        self.keys = load_public_keys(certificates)
+
+    async def get_keys(self, refresh=False):
+        return self.keys
+
+
+class GooglePublicKeys:
+    """
+    Google's token signing certificates cached in-process for as long as their Cache-Control max-age allows,
+    default_max_age without one. Only a refresh leaves the event loop, concurrent refreshes are collapsed into one.
+    """
+
+    def __init__(self, url=GOOGLE_PUBLIC_KEYS_URL, min_refresh_interval=60, default_max_age=FIREBASE_KEYS_DEFAULT_MAX_AGE):
+        self.url = url
+        self.min_refresh_interval = min_refresh_interval
+        self.default_max_age = default_max_age
+        self.keys = {}
+        self.expires_at = 0.0
+        self.fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def fetch(self):
+        response = requests.get(self.url, timeout=5)
+        response.raise_for_status()
+        match = MAX_AGE_PATTERN.search(response.headers.get("Cache-Control", ""))
+        return load_public_keys(response.json()), int(match.group(1)) if match else self.default_max_age
+
+    async def get_keys(self, refresh=False):
+        """refresh=True re-fetches for an unknown kid (key rotation), at most once per min_refresh_interval"""
+        if not self._needs_refresh(refresh):
+            return self.keys
+        async with self._lock:
+            if self._needs_refresh(refresh):
+                self.keys, max_age = await asyncio.to_thread(self.fetch)
+                self.fetched_at = time()
+                self.expires_at = self.fetched_at + max_age
+        return self.keys
+
+    def _needs_refresh(self, refresh):
+        now = time()
+        return now >= self.expires_at or (refresh and now - self.fetched_at >= self.min_refresh_interval)
+
+
+google_public_keys = GooglePublicKeys()
+
+
+async def verify_firebase_id_token(firebase_id_token, key_source=None, project_id=None):
+    """
+    Verify a Firebase ID token locally: RS256 signature against the cached Google keys, audience, issuer,
+    expiry and auth_time. Returns the claims, raises jwt.InvalidTokenError when the token is not valid.
+    """
+    key_source = key_source or google_public_keys
+    project_id = project_id or FIREBASE_PROJECT_ID
+
+    kid = jwt.get_unverified_header(firebase_id_token).get("kid")
+    keys = await key_source.get_keys()
+    if kid not in keys:
+        keys = await key_source.get_keys(refresh=True)
+    if kid not in keys:
+        raise jwt.InvalidTokenError(f"unknown key id {kid}")
+
+    claims = jwt.decode(
+        firebase_id_token,
+        keys[kid],
+        algorithms=["RS256"],
+        audience=project_id,
+        issuer=f"https://securetoken.google.com/{project_id}",
+        leeway=FIREBASE_TOKEN_LEEWAY,
+        options={"require": ["exp", "iat", "sub", "auth_time"]},
+    )
+    if not claims["sub"] or claims["auth_time"] > time() + FIREBASE_TOKEN_LEEWAY:
+        raise jwt.InvalidTokenError("invalid sub or auth_time claim")
+    claims["uid"] = claims["sub"]
+    return claims
+
+
+async def custom_firebase_validation(firebase_id_token, key_source=None):
     """
    This function receives id token sent by Firebase and
    validate the id token then check if the user exist on
    Firebase or not, if exist it returns display_name, email,
-   phone_number, photo_url else False
+   phone_number, photo_url else None.
+   The profile comes straight from the token claims when they carry email, name and picture,
+   only otherwise Firebase is asked for the user record.
    """
     try:
-        decoded_token = await asyncio.to_thread(partial(auth.verify_id_token, firebase_id_token))
-        print(f"📝 DECODED_TOKEN: {decoded_token}")
+        decoded_token = await verify_firebase_id_token(firebase_id_token, key_source=key_source)
         uid = decoded_token["uid"]
+        if all(decoded_token.get(claim) for claim in ("email", "name", "picture")):
+            return {
+                "display_name": decoded_token["name"],
+                "email": decoded_token["email"],
+                "phone_number": decoded_token.get("phone_number"),
+                "photo_url": decoded_token["picture"],
+            }
         try:
             user = await asyncio.to_thread(partial(auth.get_user, uid))
             print(f"📝 USER display_name: {user.display_name}")
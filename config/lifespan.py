@@ -0,0 +1,21 @@
+from community_app.write_buffer import message_buffer, room_member_buffer
+from shared_app.hashing import shutdown_hashing_executor
+
+
+class LifespanApp:
+    """ASGI lifespan handler, flushes process-wide buffers before the server exits"""
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for buffer in (message_buffer, room_member_buffer):
+                    try:
+                        await buffer.close()
+                    except Exception as e:
+                        print(f"🥶 error flushing write buffer on shutdown: {e}")
+                shutdown_hashing_executor()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -1,46 +1,98 @@
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from time import monotonic
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from asyncio import to_thread
-from functools import partial
+from rest_framework_simplejwt.authentication import AUTH_HEADER_TYPES, JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
 
 
-async def get_user(token):
-    # Instantiate JWTAuthentication to use its methods
-    jwt_auth = JWTAuthentication()
+# signature and expiry checks are pure CPU work, one shared instance validates in-process without a thread hop
+jwt_auth = JWTAuthentication()
 
-    try:
-        # Get validated token from raw token
-        validated_token = to_thread(jwt_auth.get_validated_token, token)
 
-        # Get the user associated with the validated token
-        user = await to_thread(partial(jwt_auth.get_user, validated_token))
+class UserSnapshotCache:
+    """
+    process-local user id -> user cache with a short TTL, absorbs reconnect storms after a deploy.
+    Keys are the id as a string, the form it has in the token claim. Saves and deletes invalidate it.
+    """
 
-        # print("validated_token: ", validated_token)
-        # print("user: ", user)
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._users = {}
 
+    def get(self, user_id):
+        cached = self._users.get(str(user_id))
+        if cached is None:
+            return None
+        user, expires_at = cached
+        if expires_at < monotonic():
+            self._users.pop(str(user_id), None)
+            return None
         return user
-    except InvalidToken or TokenError:
-        user = AnonymousUser()
+
+    def set(self, user_id, user):
+        if len(self._users) >= self.maxsize:
+            now = monotonic()
+            self._users = {key: value for key, value in self._users.items() if value[1] >= now}
+            if len(self._users) >= self.maxsize:
+                self._users.pop(next(iter(self._users)))
+        self._users[str(user_id)] = (user, monotonic() + self.ttl)
+
+    def invalidate(self, user_id):
+        self._users.pop(str(user_id), None)
+
+
+user_snapshot_cache = UserSnapshotCache(
+    ttl=settings.WEBSOCKET_USER_CACHE_TTL,
+    maxsize=settings.WEBSOCKET_USER_CACHE_SIZE,
+)
+
+
+async def get_user(token):
+    try:
+        validated_token = jwt_auth.get_validated_token(token)
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return AnonymousUser()
+
+    user = user_snapshot_cache.get(user_id)
+    if user is None:
+        try:
+            user = await get_user_model().objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except get_user_model().DoesNotExist:
+            return AnonymousUser()
+        user_snapshot_cache.set(user_id, user)
+
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        return AnonymousUser()
     return user
 
 
+def get_raw_token(scope):
+    """bearer token from the authorization header, or from ?token= for clients that can't set headers"""
+    for name, value in scope["headers"]:  # [..., (b'authorization', b'Bearer eyJ343aer...)]
+        if name == b"authorization":
+            parts = value.decode("latin1").split()
+            if len(parts) == 2 and parts[0] in AUTH_HEADER_TYPES:
+                return parts[1]
+            return None
+
+    query_string = scope.get("query_string", b"")
+    if b"token=" in query_string:
+        tokens = parse_qs(query_string.decode("latin1")).get("token")
+        if tokens:
+            return tokens[0]
+    return None
+
+
 class CustomTokenAuthMiddleWare:
     def __init__(self, app):
         self.app = app
 
     async def __call__(self, scope, receive, send):
-        headers_list_bytes = scope["headers"]  # [..., (b'authorization', b'Bearer eyJ343aer...)]
-        # headers_dict_bytes = dict(headers_list_bytes)
-        headers_dict_str = {k.decode('utf-8'): v.decode('utf-8') for k, v in headers_list_bytes}
-        auth_bearer_token = headers_dict_str.get(b"authorization")  # b'Bearer eyJ343aer...
-
-        if auth_bearer_token is None:
-            scope["user"] = AnonymousUser()
-            return await self.app(scope, receive, send)
-
-        token_type, token = auth_bearer_token.split()
-
-        user = await get_user(token)
-        scope["user"] = user
+        token = get_raw_token(scope)
+        scope["user"] = AnonymousUser() if token is None else await get_user(token)
         return await self.app(scope, receive, send)
@@ -1,4 +1,6 @@
+import os
 from datetime import timedelta
+from importlib.util import find_spec
 from pathlib import Path
 import environ
 
@@ -103,6 +105,20 @@ if USE_REDIS_FOR_CACHE:
     CELERY_TASK_TRACK_STARTED = env.bool("CELERY_TASK_TRACK_STARTED", default=True)
     CELERY_CACHE_BACKEND = "default"
     CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers.DatabaseScheduler"  # create periodic tasks in admin panel
+    CELERY_BEAT_SCHEDULE = {
+        "reconcile-follow-counts": {
+            "task": "users_app.tasks.reconcile_follow_counts_task",
+            "schedule": env.float("FOLLOW_COUNTS_RECONCILE_INTERVAL", default=60 * 60),  # seconds
+        },
+        "flush-like-counts": {
+            "task": "community_app.tasks.flush_like_counts",
+            "schedule": env.float("LIKE_COUNTS_FLUSH_INTERVAL", default=10),  # seconds
+        },
+    }
+
+# ! Cache helpers, see shared_app.cache
+CACHE_DEFAULT_SERIALIZER = env.str("CACHE_DEFAULT_SERIALIZER", default="pickle")  # pickle, msgpack or json
+CACHE_COMPRESS_MIN_SIZE = env.int("CACHE_COMPRESS_MIN_SIZE", default=1024)  # zlib-compress larger payloads
 
 # ! Rest Framework
 REST_FRAMEWORK = {
@@ -124,6 +140,10 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": "Bearer",  # also have other options ("JWT", "Bearer", "Token")
 }
 
+# ! WebSocket authentication, see config.middleware
+WEBSOCKET_USER_CACHE_TTL = env.float("WEBSOCKET_USER_CACHE_TTL", default=30)
+WEBSOCKET_USER_CACHE_SIZE = env.int("WEBSOCKET_USER_CACHE_SIZE", default=10_000)
+
 # ! Channel Layer
 if USE_REDIS_CHANNEL_LAYER:
     REDIS_CACHE_HOST = env.str('REDIS_CACHE_HOST', default='127.0.0.1')
@@ -143,6 +163,60 @@ else:
         },
     }
 
+# ! Images, see shared_app.utils.prepare_image
+IMAGE_OUTPUT_FORMAT = env.str("IMAGE_OUTPUT_FORMAT", default="WEBP")  # WEBP or JPEG
+IMAGE_QUALITY = env.int("IMAGE_QUALITY", default=80)
+IMAGE_MAX_DIMENSION = env.int("IMAGE_MAX_DIMENSION", default=1024)  # px, longest side after preparation
+IMAGE_MAX_PIXELS = env.int("IMAGE_MAX_PIXELS", default=40_000_000)  # rejected before decoding
+CONTENT_STORE_SPOOL_SIZE = env.int("CONTENT_STORE_SPOOL_SIZE", default=1024 * 1024)  # bytes kept in RAM while hashing
+IMAGE_VARIANT_SIZES = env.list("IMAGE_VARIANT_SIZES", cast=int, default=[64, 256, 1024])  # px, responsive WebP variants
+
+# ! Users
+BANNER_COLOR_SAMPLE_SIZE = env.int("BANNER_COLOR_SAMPLE_SIZE", default=128)  # px, banner is downscaled before quantization
+AVATAR_IMPORT_MAX_SIZE = env.int("AVATAR_IMPORT_MAX_SIZE", default=5 * 1024 * 1024)  # bytes, larger social photos are refused
+AVATAR_IMPORT_TIMEOUT = env.float("AVATAR_IMPORT_TIMEOUT", default=5)  # seconds, connect and read timeout of the download
+AVATAR_IMPORT_LOCK_TTL = env.int("AVATAR_IMPORT_LOCK_TTL", default=60 * 10)  # seconds, one queued import per user and photo
+
+# ! Community
+CHAT_HISTORY_PAGE_SIZE = env.int("CHAT_HISTORY_PAGE_SIZE", default=50)
+CHAT_HISTORY_MAX_PAGE_SIZE = env.int("CHAT_HISTORY_MAX_PAGE_SIZE", default=100)
+ROOM_ID_CACHE_SIZE = env.int("ROOM_ID_CACHE_SIZE", default=10_000)
+CHAT_WRITE_BUFFER_BATCH_SIZE = env.int("CHAT_WRITE_BUFFER_BATCH_SIZE", default=500)
+CHAT_WRITE_BUFFER_FLUSH_INTERVAL = env.float("CHAT_WRITE_BUFFER_FLUSH_INTERVAL", default=0.5)
+CHAT_WRITE_BUFFER_MAX_PENDING = env.int("CHAT_WRITE_BUFFER_MAX_PENDING", default=10_000)
+CHAT_WRITE_BUFFER_MAX_ATTEMPTS = env.int("CHAT_WRITE_BUFFER_MAX_ATTEMPTS", default=3)
+CHAT_WRITE_BUFFER_RETRY_DELAY = env.float("CHAT_WRITE_BUFFER_RETRY_DELAY", default=1)  # seconds, times the attempt
+CHAT_MEDIA_MAX_SIZE = env.int("CHAT_MEDIA_MAX_SIZE", default=10 * 1024 * 1024)
+CHAT_MEDIA_SPOOL_SIZE = env.int("CHAT_MEDIA_SPOOL_SIZE", default=1024 * 1024)
+ROOM_MEMBERS_FLUSH_INTERVAL = env.float("ROOM_MEMBERS_FLUSH_INTERVAL", default=5)
+PRESENCE_TTL = env.float("PRESENCE_TTL", default=60)  # clients send {"type": "heartbeat"} more often than this
+PRESENCE_REDIS_URL = env.str(
+    "PRESENCE_REDIS_URL",
+    default=f"redis://{REDIS_CACHE_HOST}:{REDIS_CACHE_PORT}" if USE_REDIS_CHANNEL_LAYER or USE_REDIS_FOR_CACHE else "",
+)
+
+# ! Follow graph, see users_app.follows
+FOLLOW_PAGE_SIZE = env.int("FOLLOW_PAGE_SIZE", default=50)
+FOLLOW_MAX_PAGE_SIZE = env.int("FOLLOW_MAX_PAGE_SIZE", default=200)
+FOLLOW_BULK_MAX_OPS = env.int("FOLLOW_BULK_MAX_OPS", default=500)  # follows + unfollows per bulk request
+FOLLOW_MUTUALS_SCAN_LIMIT = env.int("FOLLOW_MUTUALS_SCAN_LIMIT", default=5000)  # followings checked per mutuals page
+FOLLOW_GRAPH_TTL = env.int("FOLLOW_GRAPH_TTL", default=60 * 60 * 24)  # seconds a cached adjacency set lives
+FOLLOW_GRAPH_REDIS_URL = env.str("FOLLOW_GRAPH_REDIS_URL", default=PRESENCE_REDIS_URL)  # empty: read from the database
+
+# ! Feed, see community_app.timelines
+FEED_PAGE_SIZE = env.int("FEED_PAGE_SIZE", default=20)
+FEED_MAX_PAGE_SIZE = env.int("FEED_MAX_PAGE_SIZE", default=100)
+TIMELINE_MAX_LENGTH = env.int("TIMELINE_MAX_LENGTH", default=800)  # newest post ids kept per timeline
+TIMELINE_TTL = env.int("TIMELINE_TTL", default=60 * 60 * 24 * 7)  # seconds, idle timelines are rebuilt on the next read
+TIMELINE_CELEBRITY_FOLLOWERS = env.int("TIMELINE_CELEBRITY_FOLLOWERS", default=10_000)  # authors above are not fanned out
+TIMELINE_FAN_OUT_CHUNK_SIZE = env.int("TIMELINE_FAN_OUT_CHUNK_SIZE", default=1000)  # followers per Redis pipeline
+TIMELINE_REDIS_URL = env.str("TIMELINE_REDIS_URL", default=PRESENCE_REDIS_URL)  # empty: fan-out-on-read from the database
+POST_BULK_MAX_SIZE = env.int("POST_BULK_MAX_SIZE", default=5000)  # posts per bulk import request
+
+# ! Likes, see community_app.likes
+LIKES_LOOKUP_MAX_IDS = env.int("LIKES_LOOKUP_MAX_IDS", default=200)  # ids per like lookup request
+LIKE_COUNTS_REDIS_URL = env.str("LIKE_COUNTS_REDIS_URL", default=PRESENCE_REDIS_URL)  # empty: counters updated per like
+
 # ! Database
 if USE_SQLITE3:
     DATABASES = {
@@ -186,6 +260,19 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# ! Password hashing, see shared_app.hashing
+PASSWORD_HASHING_EXECUTOR = env.str("PASSWORD_HASHING_EXECUTOR", default="thread")  # thread | process
+PASSWORD_HASHING_WORKERS = env.int("PASSWORD_HASHING_WORKERS", default=os.cpu_count() or 1)
+PASSWORD_PBKDF2_ITERATIONS = env.int("PASSWORD_PBKDF2_ITERATIONS", default=0)  # 0 keeps Django's default
+PASSWORD_USE_ARGON2 = env.bool("PASSWORD_USE_ARGON2", default=False) and find_spec("argon2") is not None
+PASSWORD_HASHERS = [
+    # the first one hashes new passwords, the others verify old hashes which are upgraded on the next login
+    *(["django.contrib.auth.hashers.Argon2PasswordHasher"] if PASSWORD_USE_ARGON2 else []),
+    "shared_app.hashing.ConfigurablePBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -219,6 +306,9 @@ if STORAGE_DESTINATION == "s3":
     AWS_QUERYSTRING_EXPIRE = 604800
     AWS_S3_SIGNATURE_VERSION = "s3v4"
     AWS_S3_OBJECT_PARAMETERS = {"CacheControl": "max-age=86400"}
+    AWS_S3_ENDPOINT_URL = env.str("AWS_S3_ENDPOINT_URL", default="")  # e.g. a local moto server
+    AWS_S3_MAX_POOL_CONNECTIONS = env.int("AWS_S3_MAX_POOL_CONNECTIONS", default=50)
+    AWS_S3_DELETE_CONCURRENCY = env.int("AWS_S3_DELETE_CONCURRENCY", default=8)  # parallel delete_objects batches
 
     AWS_CUSTOM_DOMAIN = "https://s468.s3-cdn-clients.arviol.com"
 
@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import StoredObject
 
-# Register your models here.
+
+class StoredObjectAdmin(admin.ModelAdmin):
+    list_display = ["key", "size", "refcount"]
+
+
+admin.site.register(StoredObject, StoredObjectAdmin)
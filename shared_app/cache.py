@@ -0,0 +1,251 @@
+import asyncio
+import json
+import math
+import pickle
+import random
+import zlib
+from time import perf_counter, time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# TODO serializers, the first byte of every stored payload tells how to decode it
+PICKLE, JSON, MSGPACK = b"p", b"j", b"m"
+COMPRESSED = b"z"
+
+
+def _dumps(value, serializer):
+    if serializer == "pickle":
+        return PICKLE + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if serializer == "json":
+        return JSON + json.dumps(value).encode("utf-8")
+    if serializer == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack serializer requested but msgpack is not installed.")
+        return MSGPACK + msgpack.packb(value, use_bin_type=True)
+    raise ValueError(f"Unknown cache serializer: {serializer}")
+
+
+def _loads(data):
+    kind, body = data[:1], data[1:]
+    if kind == PICKLE:
+        return pickle.loads(body)
+    if kind == JSON:
+        return json.loads(body)
+    if kind == MSGPACK:
+        return msgpack.unpackb(body, raw=False)
+    raise ValueError(f"Unknown cache payload kind: {kind}")
+
+
+def encode(value, serializer=None):
+    data = _dumps(value, serializer or settings.CACHE_DEFAULT_SERIALIZER)
+    if len(data) >= settings.CACHE_COMPRESS_MIN_SIZE:
+        data = COMPRESSED + zlib.compress(data)
+    return data
+
+
+def decode(data):
+    if data[:1] == COMPRESSED:
+        data = zlib.decompress(data[1:])
+    return _loads(data)
+
+
+class CacheStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.early_refreshes = 0
+        self.errors = 0
+        self.get_seconds = 0.0
+        self.compute_seconds = 0.0
+
+    def snapshot(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "early_refreshes": self.early_refreshes,
+            "errors": self.errors,
+            "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            "avg_get_ms": self.get_seconds * 1000 / lookups if lookups else 0.0,
+            "avg_compute_ms": self.compute_seconds * 1000 / self.misses if self.misses else 0.0,
+        }
+
+
+cache_stats = CacheStats()
+
+# key -> future of the computation running in this process
+_inflight = {}
+
+
+def _is_negative(value):
+    return value is None or value == [] or value == {}
+
+
+def _unwrap(payload):
+    """the cached value, payload is None for negative entries written before empty values were stored as is"""
+    value = None if payload is None else decode(payload)
+    if _is_negative(value):
+        cache_stats.negative_hits += 1
+    else:
+        cache_stats.hits += 1
+    return value
+
+
+async def _read_envelope(key):
+    """stored envelope is (payload, expires_at, compute_seconds)"""
+    started = perf_counter()
+    try:
+        return await cache.aget(key)
+    except Exception as e:
+        cache_stats.errors += 1
+        print(f"🥶 error reading cache key {key}: {e}")
+        return None
+    finally:
+        cache_stats.get_seconds += perf_counter() - started
+
+
+def _should_refresh_early(expires_at, compute_seconds, beta):
+    # XFetch: recompute a little before expiry with a probability that grows as expiry approaches
+    return time() - compute_seconds * beta * math.log(random.random() or 1e-12) >= expires_at
+
+
+async def _compute_and_store(key, callable_queryset, expire_time, negative_expire_time, serializer):
+    started = perf_counter()
+    value = await sync_to_async(callable_queryset)()
+    compute_seconds = perf_counter() - started
+    cache_stats.compute_seconds += compute_seconds
+
+    # empty results are stored as they are, a negative hit returns the same [] or {} as the computation
+    timeout = negative_expire_time if _is_negative(value) else expire_time
+    envelope = (encode(value, serializer), time() + timeout, compute_seconds)
+    try:
+        await cache.aset(key, envelope, timeout)
+    except Exception as e:
+        cache_stats.errors += 1
+        print(f"🥶 error writing cache key {key}: {e}")
+    return value
+
+
+async def _acquire_lock(lock_key, lock_timeout):
+    """True when the lock was taken, False when another process holds it, None when the cache can't be reached"""
+    try:
+        return await cache.aadd(lock_key, 1, lock_timeout)
+    except Exception as e:
+        cache_stats.errors += 1
+        print(f"🥶 error taking cache lock {lock_key}: {e}")
+        return None
+
+
+async def _release_lock(lock_key):
+    try:
+        await cache.adelete(lock_key)
+    except Exception as e:
+        cache_stats.errors += 1
+        print(f"🥶 error releasing cache lock {lock_key}: {e}")
+
+
+async def _single_flight(key, compute):
+    """one computation per key per process, concurrent callers await the same result"""
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await compute()
+        future.set_result(value)
+        return value
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark as retrieved when nobody else is waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+async def cache_get_or_set(key, callable_queryset, expire_time=60 * 15, negative_expire_time=60, serializer=None,
+                           beta=1.0, lock_timeout=10):
+    """
+    Return the cached value of key, or compute callable_queryset (sync), cache and return it.
+    Empty results are cached for negative_expire_time. Concurrent misses are collapsed per process and,
+    through a cache.add lock, across processes. Hot keys are refreshed early (XFetch), callers that don't
+    win the lock keep getting the current value. When the lock itself can't be taken, the value is computed
+    without it.
+    """
+    lock_key = f"{key}:lock"
+    envelope = await _read_envelope(key)
+    if envelope is not None:
+        payload, expires_at, compute_seconds = envelope
+        if not _should_refresh_early(expires_at, compute_seconds, beta):
+            return _unwrap(payload)
+
+        locked = await _acquire_lock(lock_key, lock_timeout)
+        if locked is not False:
+            cache_stats.early_refreshes += 1
+            try:
+                return await _single_flight(key, lambda: _compute_and_store(
+                    key, callable_queryset, expire_time, negative_expire_time, serializer,
+                ))
+            finally:
+                if locked:
+                    await _release_lock(lock_key)
+        return _unwrap(payload)
+
+    cache_stats.misses += 1
+
+    async def compute():
+        locked = await _acquire_lock(lock_key, lock_timeout)
+        if locked is not False:
+            try:
+                return await _compute_and_store(key, callable_queryset, expire_time, negative_expire_time, serializer)
+            finally:
+                if locked:
+                    await _release_lock(lock_key)
+
+        # another process is computing, wait for its result before falling back to computing ourselves
+        deadline = perf_counter() + lock_timeout
+        while perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+            envelope = await _read_envelope(key)
+            if envelope is not None:
+                return _unwrap(envelope[0])
+        return await _compute_and_store(key, callable_queryset, expire_time, negative_expire_time, serializer)
+
+    return await _single_flight(key, compute)
+
+
+async def cache_get(key, default=None):
+    envelope = await _read_envelope(key)
+    if envelope is None:
+        cache_stats.misses += 1
+        return default
+    payload = envelope[0]
+    value = _unwrap(payload)
+    return default if payload is None else value
+
+
+async def cache_set(key, value, expire_time=60 * 15, serializer=None):
+    try:
+        await cache.aset(key, (encode(value, serializer), time() + expire_time, 0.0), expire_time)
+        return True
+    except Exception as e:
+        cache_stats.errors += 1
+        print(f"🥶 error writing cache key {key}: {e}")
+        return False
+
+
+async def cache_delete(key):
+    await cache.adelete(key)
@@ -0,0 +1,96 @@
+import hashlib
+from tempfile import SpooledTemporaryFile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from shared_app.models import StoredObject
+
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_PREFIX = "cas/"
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=32)
+
+
+def spool_and_hash(fileobj):
+    """copy fileobj into a spooled temp file while hashing it, return (digest, size, spooled file)"""
+    hasher = new_hasher()
+    size = 0
+    spooled = SpooledTemporaryFile(max_size=settings.CONTENT_STORE_SPOOL_SIZE)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        hasher.update(chunk)
+        spooled.write(chunk)
+        size += len(chunk)
+    spooled.seek(0)
+    return hasher.hexdigest(), size, spooled
+
+
+def get_content_key(digest, extension):
+    return f"{CONTENT_PREFIX}{digest[:2]}/{digest}.{extension.lstrip('.') or 'bin'}"
+
+
+def is_content_key(name):
+    return bool(name) and name.startswith(CONTENT_PREFIX)
+
+
+def _add_reference(digest):
+    if StoredObject.objects.filter(digest=digest).update(refcount=F("refcount") + 1):
+        return StoredObject.objects.values_list("key", flat=True).get(digest=digest)
+    return None
+
+
+def store_content(fileobj, extension, digest=None, size=None):
+    """
+    Store fileobj under a content-addressed key and return the key. Identical content already stored
+    only gains a reference, nothing is written. Pass digest/size when the caller hashed while streaming.
+    """
+    if digest is None:
+        digest, size, fileobj = spool_and_hash(fileobj)
+
+    key = _add_reference(digest)
+    if key is not None:
+        return key
+
+    fileobj.seek(0)
+    stored_key = default_storage.save(get_content_key(digest, extension), File(fileobj))
+    try:
+        with transaction.atomic():
+            StoredObject.objects.create(key=stored_key, digest=digest, size=size, refcount=1)
+        return stored_key
+    except IntegrityError:
+        # a concurrent upload of the same content registered first, drop our copy and share theirs
+        key = _add_reference(digest)
+        if key != stored_key:
+            default_storage.delete(stored_key)
+        return key
+
+
+def release_content(name):
+    """drop one reference to a content-addressed object, delete it with its variants on the last one"""
+    if not is_content_key(name):
+        return False
+
+    with transaction.atomic():
+        stored_object = StoredObject.objects.select_for_update().filter(key=name).first()
+        if stored_object is None:
+            return False
+        if stored_object.refcount > 1:
+            StoredObject.objects.filter(id=stored_object.id).update(refcount=F("refcount") - 1)
+            return True
+        stored_object.delete()
+        transaction.on_commit(lambda: delete_content_files(name))
+    return True
+
+
+def delete_content_files(name):
+    from shared_app.utils import get_variant_name
+
+    for file_name in [name, *(get_variant_name(name, size) for size in settings.IMAGE_VARIANT_SIZES)]:
+        try:
+            default_storage.delete(file_name)
+        except Exception as e:
+            print(f"🥶 error deleting {file_name}: {e}")
@@ -0,0 +1,107 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    check_password,
+    get_hasher,
+    identify_hasher,
+    is_password_usable,
+    make_password,
+)
+
+
+_executor = None
+_executor_lock = Lock()
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 with the iteration count taken from PASSWORD_PBKDF2_ITERATIONS. Same algorithm name,
+    so existing hashes keep verifying and are rehashed on login when the count changes (must_update).
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS or PBKDF2PasswordHasher.iterations
+
+
+def get_hashing_executor():
+    """
+    Bounded pool dedicated to password hashing. A login burst queues here instead of filling the default
+    to_thread pool or the thread_sensitive thread that serves every ORM call of the process.
+    hashlib's PBKDF2 and argon2 release the GIL, so threads use all cores; the process pool is for hashers that don't.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if settings.PASSWORD_HASHING_EXECUTOR == "process":
+                    _executor = ProcessPoolExecutor(
+                        max_workers=settings.PASSWORD_HASHING_WORKERS, initializer=django.setup,
+                    )
+                else:
+                    _executor = ThreadPoolExecutor(
+                        max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix="password-hashing",
+                    )
+    return _executor
+
+
+def shutdown_hashing_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def run_in_hashing_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_hashing_executor(), func, *args)
+
+
+async def amake_password(password):
+    return await run_in_hashing_executor(make_password, password)
+
+
+async def acheck_password(password, encoded):
+    return await run_in_hashing_executor(check_password, password, encoded)
+
+
+def is_password_hashed(password):
+    """True for encoded and unusable passwords, False for a raw password that still has to be hashed"""
+    if not is_password_usable(password):
+        return True
+    try:
+        identify_hasher(password)
+        return True
+    except ValueError:
+        return False
+
+
+def needs_rehash(encoded):
+    """the stored hash uses another algorithm or cost than the preferred hasher"""
+    preferred = get_hasher("default")
+    return identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+async def aauthenticate(username, password):
+    """
+    ModelBackend.authenticate with the hash check in the hashing executor. An unknown username costs one hash
+    as well, so response time doesn't tell which usernames exist. Outdated hashes are upgraded on success.
+    """
+    user_model = get_user_model()
+    user = await user_model.objects.filter(**{user_model.USERNAME_FIELD: username}).afirst()
+    if user is None:
+        await amake_password(password)
+        return None
+
+    if not await acheck_password(password, user.password) or not user.is_active:
+        return None
+
+    if needs_rehash(user.password):
+        user.password = await amake_password(password)
+        await user_model.objects.filter(pk=user.pk).aupdate(password=user.password)
+    return user
@@ -13,3 +13,14 @@ class BaseModel(models.Model):
 
     def __str__(self):
         return f"BaseModel id: {str(self.id)}"
+
+
+class StoredObject(BaseModel):
+    """key, digest, size, refcount - content-addressed media object shared by every row that references it"""
+    key = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.key} ({self.refcount} refs)"
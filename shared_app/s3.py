@@ -0,0 +1,103 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+from time import sleep
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+
+_s3_client = None
+_s3_client_lock = Lock()
+
+
+def get_s3_config():
+    return Config(
+        region_name=settings.AWS_S3_REGION_NAME,
+        signature_version="s3v4",
+        max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={"max_attempts": 3, "mode": "standard"},
+    )
+
+
+def get_s3_client_kwargs():
+    return {
+        "service_name": "s3",
+        "aws_access_key_id": settings.AWS_S3_ACCESS_KEY_ID,
+        "aws_secret_access_key": settings.AWS_S3_SECRET_ACCESS_KEY,
+        "endpoint_url": settings.AWS_S3_ENDPOINT_URL or None,  # local S3 stand-in such as moto
+        "config": get_s3_config(),
+    }
+
+
+def get_s3_client():
+    """
+    Process-wide boto3 S3 client. botocore models are parsed once and the connection pool is reused,
+    boto3 clients are thread-safe so every to_thread call can share it.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.session.Session().client(**get_s3_client_kwargs())
+    return _s3_client
+
+
+def reset_s3_clients():
+    """drop the cached client, e.g. after changing S3 settings in tests"""
+    global _s3_client
+    with _s3_client_lock:
+        _s3_client = None
+
+
+def _delete_batch(s3, bucket, keys, max_attempts):
+    """delete up to 1000 keys, retrying the keys S3 reports as failed, return the keys that still failed"""
+    for attempt in range(max_attempts):
+        response = s3.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        keys = [error["Key"] for error in response.get("Errors", [])]
+        if not keys:
+            return []
+        sleep(0.2 * 2 ** attempt)
+    return keys
+
+
+def delete_prefix(prefix, concurrency=None, max_attempts=3, on_progress=None):
+    """
+    Delete every object under prefix: pages through list_objects_v2 with continuation tokens and runs
+    delete_objects batches of 1000 keys concurrently, at most `concurrency` in flight.
+    on_progress(deleted, failed) is called after each finished batch. Returns (deleted, failed keys).
+    """
+    s3 = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    concurrency = concurrency or settings.AWS_S3_DELETE_CONCURRENCY
+    deleted = 0
+    failed = []
+    in_flight = set()
+
+    def collect(done):
+        nonlocal deleted
+        for future in done:
+            batch_size, failed_keys = future.result()
+            deleted += batch_size - len(failed_keys)
+            failed.extend(failed_keys)
+            if on_progress is not None:
+                on_progress(deleted, len(failed))
+
+    def delete(keys):
+        return len(keys), _delete_batch(s3, bucket, keys, max_attempts)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            keys = [obj["Key"] for obj in page.get("Contents", [])]
+            if not keys:
+                continue
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(executor.submit(delete, keys))
+        collect(wait(in_flight).done)
+
+    return deleted, failed
@@ -1,8 +1,11 @@
 from datetime import timedelta
 from django.utils import timezone
 import re
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from shared_app.utils import cache_get_or_set
+from django.db.models import Q
+from django.db.models.functions import Lower
+from shared_app.cache import cache_get_or_set
 from users_app.models import Profession, Gender
 
 CustomUser = get_user_model()
@@ -54,34 +57,39 @@ class CustomSerializerValidator:
         return False
 
     @classmethod
-    async def validate_to_user_exists(cls, username, email=None, phone_number=None, first_name=None, last_name=None):
-        cached_users_list = await cache_get_or_set(
-            key="users_list",
-            callable_queryset=lambda: list(CustomUser.objects.values_list(
-                "username", "email", "phone_number", "first_name", "last_name",
-            )),
-            expire_time=60 * 60 * 3,
-        )
-
-        print("cached_users_list >>>", cached_users_list, type(cached_users_list))
-
-        # TODO Extract relevant information while filtering out None values
-        usernames = [user[0] for user in cached_users_list]
-        emails = [user[1] for user in cached_users_list if user[1] is not None]
-        phone_numbers = [user[2] for user in cached_users_list if user[2] is not None]
-        name_pairs = [
-            (user[3].lower(), user[4].lower())
-            for user in cached_users_list if user[3] and user[4]
-        ]
-
-        if username in usernames:
+    async def validate_to_user_exists(cls, username, email=None, phone_number=None, first_name=None, last_name=None,
+                                      exclude_user_id=None):
+        # TODO one indexed query: username/email/phone_number unique indexes and user_full_name_lower_idx
+        lookups = Q()
+        if username:
+            lookups |= Q(username=username)
+        if email:
+            lookups |= Q(email=email)
+        if phone_number:
+            lookups |= Q(phone_number=phone_number)
+        if first_name and last_name:
+            lookups |= Q(lower_first_name=first_name.lower(), lower_last_name=last_name.lower())
+
+        if not lookups:
+            return False
+
+        queryset = CustomUser.objects.alias(
+            lower_first_name=Lower("first_name"), lower_last_name=Lower("last_name"),
+        ).filter(lookups)
+        if exclude_user_id:
+            queryset = queryset.exclude(id=exclude_user_id)
+
+        existing_users = await sync_to_async(lambda: list(queryset.values_list(
+            "username", "email", "phone_number", "first_name", "last_name",
+        )[:4]))()
+
+        if username and any(user[0] == username for user in existing_users):
             return cls.username_exists_error
-        if email and email in emails:
+        if email and any(user[1] == email for user in existing_users):
             return cls.email_exists_error
-        if phone_number and phone_number in phone_numbers:
+        if phone_number and any(user[2] == phone_number for user in existing_users):
             return cls.phone_number_exists_error
-
-        if first_name and last_name and (first_name.lower(), last_name.lower()) in name_pairs:
+        if existing_users and first_name and last_name:
             return cls.full_name_exists_error
 
         return False
@@ -132,13 +140,11 @@ class CustomSerializerValidator:
             expire_time=60 * 60 * 3,
         )
 
-        print("cached_professions_list >>>", cached_professions_list, type(cached_professions_list))
-
         if profession_id and cached_professions_list:
-            profession_ids = [prof[0] for prof in cached_professions_list]
-            print("profession_ids >>>", profession_ids, type(profession_ids))
+            profession_ids = {prof[0] for prof in cached_professions_list}
 
-            if profession_id not in profession_ids:
+            # the serializer hands over a Profession instance, callers may also pass a bare id
+            if getattr(profession_id, "pk", profession_id) not in profession_ids:
                 return cls.profession_id_invalid_error
 
         return False
@@ -0,0 +1,62 @@
+import os
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from config.celery import app
+from shared_app.utils import generate_image_variants
+
+
+def has_own_image(image_field_file):
+    # defaults are shared by everyone and social-login avatars may be stored as absolute URLs
+    name = image_field_file.name if image_field_file else ""
+    return bool(name) and not name.startswith(("defaults/", "http://", "https://"))
+
+
+def needs_image_variants(instance, field_name):
+    """
+    True when the field holds an own image whose variants were not generated yet, or went back to a default
+    while the variants of the previous image are still recorded
+    """
+    image_field_file = getattr(instance, field_name)
+    variants = (instance.image_variants or {}).get(field_name) or {}
+    if not has_own_image(image_field_file):
+        return bool(variants)
+    base_name = os.path.splitext(image_field_file.name)[0]
+    return not variants or not all(name.startswith(f"{base_name}_") for name in variants.values())
+
+
+@app.task(ignore_result=True)
+def generate_image_variants_task(model_label, pk, field_names):
+    """generate the IMAGE_VARIANT_SIZES WebP variants of the given image fields and record them in image_variants"""
+    model = apps.get_model(model_label)
+    instance = model.objects.only("pk", *field_names).filter(pk=pk).first()
+    if instance is None:
+        return
+
+    # the images are processed without any lock, None drops the variants of a field back on a default image
+    generated = {}
+    for field_name in field_names:
+        image_field_file = getattr(instance, field_name)
+        if not has_own_image(image_field_file):
+            generated[field_name] = (image_field_file.name, None)
+            continue
+        with image_field_file.open("rb") as image_file:
+            generated[field_name] = (image_field_file.name, generate_image_variants(
+                image_file, image_field_file.name, settings.IMAGE_VARIANT_SIZES,
+            ))
+
+    # only this task's keys are written, under a row lock: the avatar and banner tasks of a user don't overwrite
+    # each other, and variants of an image replaced meanwhile are left to the task queued for the new one
+    with transaction.atomic():
+        current = model.objects.select_for_update().only("pk", "image_variants", *field_names).filter(pk=pk).first()
+        if current is None:
+            return
+        image_variants = dict(current.image_variants or {})
+        for field_name, (image_name, variants) in generated.items():
+            if getattr(current, field_name).name != image_name:
+                continue
+            if variants is None:
+                image_variants.pop(field_name, None)
+            else:
+                image_variants[field_name] = variants
+        model.objects.filter(pk=pk).update(image_variants=image_variants)
@@ -1,3 +1,137 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
+from django.core.cache import cache
+from unittest import skipIf
+from django.test import SimpleTestCase, TestCase, override_settings
+from shared_app.cache import cache_get_or_set, cache_stats
+from shared_app.s3 import delete_prefix, get_s3_client, reset_s3_clients
+from shared_app.tasks import generate_image_variants_task, needs_image_variants
+from shared_app.utils import get_srcset
+from users_app.models import CustomUser
 
-# Create your tests here.
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+class CacheGetOrSetTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+
+    def test_negative_hit_returns_the_computed_empty_value(self):
+        computed = asyncio.run(cache_get_or_set("empty", lambda: []))
+        cached = asyncio.run(cache_get_or_set("empty", lambda: ["not", "called"]))
+        self.assertEqual((computed, cached), ([], []))
+        self.assertEqual(cache_stats.negative_hits, 1)
+
+    def test_value_is_computed_when_the_lock_cannot_be_taken(self):
+        with mock.patch.object(cache, "aadd", side_effect=ConnectionError("cache is gone")):
+            value = asyncio.run(cache_get_or_set("professions", lambda: ["engineer"]))
+        self.assertEqual(value, ["engineer"])
+        self.assertEqual(cache_stats.errors, 1)
+        self.assertEqual(asyncio.run(cache_get_or_set("professions", lambda: [])), ["engineer"])
+
+
+class ImageVariantsTests(SimpleTestCase):
+    def test_default_image_with_recorded_variants_needs_the_task(self):
+        user = CustomUser(username="user", image_variants={"avatar": {"64": "users/user_user/avatar_64.webp"}})
+        self.assertTrue(needs_image_variants(user, "avatar"))
+        self.assertFalse(needs_image_variants(user, "banner"))
+
+    def test_srcset_leaves_out_variants_of_a_previous_image(self):
+        user = CustomUser(
+            username="user", avatar="users/user_user/new.png", banner="users/user_user/banner.png",
+            image_variants={
+                "avatar": {"64": "users/user_user/old_64.webp"},
+                "banner": {"64": "users/user_user/banner_64.webp"},
+            },
+        )
+        self.assertEqual(get_srcset(user, "avatar"), {})
+        self.assertEqual(list(get_srcset(user, "banner")), ["64"])
+        user.avatar = "defaults/default_avatar.png"
+        self.assertEqual(get_srcset(user, "avatar"), {})
+
+
+class ImageVariantsTaskTests(TestCase):
+    def test_only_the_given_fields_are_written(self):
+        [user] = CustomUser.objects.bulk_create([CustomUser(username="user", image_variants={
+            "avatar": {"64": "users/old_avatar_64.webp"}, "banner": {"64": "users/banner_64.webp"},
+        })])
+        with mock.patch("shared_app.tasks.generate_image_variants") as generate:
+            generate_image_variants_task("users_app.CustomUser", user.id, ["avatar"])  # back on the default avatar
+
+        generate.assert_not_called()
+        user.refresh_from_db()
+        self.assertEqual(user.image_variants, {"banner": {"64": "users/banner_64.webp"}})
+
+
+@skipIf(mock_aws is None, "moto is not installed")
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME="media",
+    AWS_S3_REGION_NAME="us-east-1",
+    AWS_S3_ACCESS_KEY_ID="testing",
+    AWS_S3_SECRET_ACCESS_KEY="testing",
+    AWS_S3_ENDPOINT_URL="",
+    AWS_S3_MAX_POOL_CONNECTIONS=10,
+    AWS_S3_DELETE_CONCURRENCY=4,
+)
+class DeletePrefixTests(SimpleTestCase):
+    prefix = "media/users/user_test/"
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        reset_s3_clients()
+        self.addCleanup(reset_s3_clients)
+
+        self.s3 = get_s3_client()
+        self.s3.create_bucket(Bucket="media")
+        # more than one list_objects_v2 page and one delete_objects batch
+        for number in range(1005):
+            self.s3.put_object(Bucket="media", Key=f"{self.prefix}{number}.webp", Body=b"")
+        self.s3.put_object(Bucket="media", Key="media/users/user_other/avatar.webp", Body=b"")
+
+    def remaining_keys(self):
+        return [obj["Key"] for obj in self.s3.list_objects_v2(Bucket="media").get("Contents", [])]
+
+    def fail_keys_once(self, failing_keys):
+        """delete_objects reports failing_keys as errors the first time it sees them"""
+        delete_objects = self.s3.delete_objects
+        failed_once = set()
+
+        def flaky_delete_objects(Bucket, Delete):
+            keys = [obj["Key"] for obj in Delete["Objects"]]
+            failing = [key for key in keys if key in failing_keys and key not in failed_once]
+            failed_once.update(failing)
+            delete_objects(Bucket=Bucket, Delete={**Delete, "Objects": [
+                {"Key": key} for key in keys if key not in failing
+            ]})
+            return {"Errors": [{"Key": key, "Code": "SlowDown"} for key in failing]}
+
+        return mock.patch.object(self.s3, "delete_objects", side_effect=flaky_delete_objects)
+
+    def test_deletes_every_page_under_the_prefix(self):
+        progress = []
+        deleted, failed = delete_prefix(self.prefix, on_progress=lambda *counts: progress.append(counts))
+        self.assertEqual((deleted, failed), (1005, []))
+        self.assertEqual(len(progress), 2)
+        self.assertEqual(self.remaining_keys(), ["media/users/user_other/avatar.webp"])
+
+    @mock.patch("shared_app.s3.sleep")
+    def test_failed_keys_are_retried(self, sleep):
+        failing_keys = {f"{self.prefix}{number}.webp" for number in (0, 500, 1004)}
+        with self.fail_keys_once(failing_keys):
+            deleted, failed = delete_prefix(self.prefix)
+        self.assertEqual((deleted, failed), (1005, []))
+        self.assertEqual(self.remaining_keys(), ["media/users/user_other/avatar.webp"])
+
+    @mock.patch("shared_app.s3.sleep")
+    def test_keys_failing_every_attempt_are_returned(self, sleep):
+        failing_key = f"{self.prefix}7.webp"
+        with self.fail_keys_once({failing_key}):
+            deleted, failed = delete_prefix(self.prefix, max_attempts=1)
+        self.assertEqual((deleted, failed), (1004, [failing_key]))
+        self.assertIn(failing_key, self.remaining_keys())
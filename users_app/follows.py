@@ -0,0 +1,343 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from users_app.models import CustomUser, Follow
+
+
+FOLLOWERS, FOLLOWINGS, MUTUALS = "followers", "followings", "mutuals"
+# kind -> (Follow column holding the listed users, Follow column holding the owner of the list)
+EDGE_FIELDS = {FOLLOWERS: ("follower_id", "following_id"), FOLLOWINGS: ("following_id", "follower_id")}
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# set while follow_users / unfollow_users update the counters for a whole batch, the Follow signal receivers skip it
+_counted_in_batch = ContextVar("follow_counted_in_batch", default=False)
+
+
+class InvalidFollowCursor(Exception):
+    pass
+
+
+def to_score(created_time):
+    """follow time as integer microseconds, exact in a Redis score (< 2**53)"""
+    return (created_time - EPOCH) // timedelta(microseconds=1)
+
+
+def from_score(score):
+    return EPOCH + timedelta(microseconds=int(score))
+
+
+def format_cursor(row):
+    user_id, score = row
+    return f"{score}_{user_id}"
+
+
+def parse_cursor(cursor):
+    """
+    "{score}_{user id}" -> (score, user id). The user id breaks ties between follows of the same microsecond,
+    a bulk follow gives all its rows one created_time.
+    """
+    if cursor in (None, ""):
+        return None
+    try:
+        score, user_id = cursor.split("_", 1)
+        return int(score), UUID(user_id)
+    except ValueError as e:
+        raise InvalidFollowCursor(f"Invalid cursor: {cursor}") from e
+
+
+def get_page_size(limit):
+    if limit is None:
+        return settings.FOLLOW_PAGE_SIZE
+    try:
+        return max(1, min(int(limit), settings.FOLLOW_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise InvalidFollowCursor(f"Invalid limit: {limit}")
+
+
+def _page(rows, limit):
+    """rows are (user id, score) newest first, one more than limit when there is a next page"""
+    if len(rows) > limit:
+        return rows[:limit], format_cursor(rows[limit - 1])
+    return rows, None
+
+
+# TODO counters
+def change_follow_counts(follower_id, following_ids, delta):
+    """atomic counter updates, no read-modify-write: followers of each followed user, followings of the follower"""
+    if not following_ids:
+        return
+    CustomUser.objects.filter(id__in=following_ids).update(followers_count=F("followers_count") + delta)
+    CustomUser.objects.filter(id=follower_id).update(followings_count=F("followings_count") + delta * len(following_ids))
+
+
+def _count_subquery(field_name):
+    counts = (
+        Follow.objects.filter(**{field_name: OuterRef("pk")})
+        .order_by()
+        .values(field_name)
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile_follow_counts():
+    """recount from the Follow table and fix the users whose stored counters drifted, return how many were fixed"""
+    actual_followers, actual_followings = _count_subquery("following"), _count_subquery("follower")
+    drifted_ids = list(
+        CustomUser.objects.annotate(actual_followers=actual_followers, actual_followings=actual_followings)
+        .filter(~Q(followers_count=F("actual_followers")) | ~Q(followings_count=F("actual_followings")))
+        .values_list("id", flat=True)
+    )
+    if drifted_ids:
+        CustomUser.objects.filter(id__in=drifted_ids).update(
+            followers_count=actual_followers, followings_count=actual_followings,
+        )
+    return len(drifted_ids)
+
+
+def is_counted_in_batch():
+    return _counted_in_batch.get()
+
+
+@contextmanager
+def counted_in_batch():
+    token = _counted_in_batch.set(True)
+    try:
+        yield
+    finally:
+        _counted_in_batch.reset(token)
+
+
+def lock_follower(follower_id):
+    """row lock on the follower: the follow changes of one user are serialized, so what they read stays true"""
+    list(CustomUser.objects.select_for_update().filter(id=follower_id).values_list("id", flat=True))
+
+
+# TODO follow / unfollow
+def follow_users(follower_id, following_ids):
+    """
+    Follow every existing user of following_ids not followed yet: one query for the new targets, one bulk insert,
+    two counter updates. Returns [(followed user id, score)] of the created follows.
+    """
+    following_ids = set(following_ids) - {follower_id}
+    if not following_ids:
+        return []
+    with transaction.atomic():
+        lock_follower(follower_id)
+        new_ids = list(
+            CustomUser.objects.filter(id__in=following_ids)
+            .exclude(following__follower_id=follower_id)
+            .values_list("id", flat=True)
+        )
+        # no concurrent request of this follower can insert the same pairs while the lock is held
+        follows = Follow.objects.bulk_create(
+            [Follow(follower_id=follower_id, following_id=following_id) for following_id in new_ids],
+        )
+        change_follow_counts(follower_id, new_ids, 1)
+    return [(follow.following_id, to_score(follow.created_time)) for follow in follows]
+
+
+def unfollow_users(follower_id, following_ids):
+    """delete the follows of follower_id to following_ids, return the ids that were actually unfollowed"""
+    if not following_ids:
+        return []
+    with transaction.atomic():
+        lock_follower(follower_id)
+        follows = Follow.objects.filter(follower_id=follower_id, following_id__in=following_ids)
+        removed_ids = list(follows.values_list("following_id", flat=True))
+        with counted_in_batch():
+            follows.delete()
+        change_follow_counts(follower_id, removed_ids, -1)
+    return removed_ids
+
+
+def apply_follow_ops(follower_id, follow_ids=(), unfollow_ids=()):
+    """follows and unfollows of one user applied in a single transaction"""
+    with transaction.atomic():
+        return follow_users(follower_id, follow_ids), unfollow_users(follower_id, unfollow_ids)
+
+
+async def update_follows(follower_id, follow_ids=(), unfollow_ids=()):
+    added, removed_ids = await sync_to_async(apply_follow_ops)(follower_id, follow_ids, unfollow_ids)
+    try:
+        await follow_graph.added(follower_id, added)
+        await follow_graph.removed(follower_id, removed_ids)
+    except Exception as e:
+        # Follow stays the source of truth, the cached sets catch up when they expire
+        print(f"🥶 error updating follow graph of {follower_id}: {e}")
+    return [following_id for following_id, score in added], removed_ids
+
+
+# TODO adjacency
+class DatabaseFollowGraph:
+    """adjacency read straight from Follow, used when no Redis is configured"""
+
+    @staticmethod
+    async def _rows(follows, listed_field, cursor, limit):
+        """keyset over (created_time, listed user id), unique within one list"""
+        if cursor is not None:
+            score, listed_id = cursor
+            created_time = from_score(score)
+            follows = follows.filter(
+                Q(created_time__lt=created_time) | Q(created_time=created_time, **{f"{listed_field}__lt": listed_id})
+            )
+        rows = follows.order_by("-created_time", f"-{listed_field}").values_list(listed_field, "created_time")
+        rows = rows[:limit + 1]
+        return _page([(user_id, to_score(created_time)) async for user_id, created_time in rows], limit)
+
+    async def page(self, kind, user_id, cursor=None, limit=None):
+        listed_field, owner_field = EDGE_FIELDS[kind]
+        return await self._rows(Follow.objects.filter(**{owner_field: user_id}), listed_field, cursor, limit)
+
+    async def mutuals(self, user_id, cursor=None, limit=None):
+        follows = Follow.objects.filter(follower_id=user_id).filter(
+            Exists(Follow.objects.filter(follower_id=OuterRef("following_id"), following_id=user_id))
+        )
+        return await self._rows(follows, "following_id", cursor, limit)
+
+    async def added(self, follower_id, edges):
+        pass
+
+    async def removed(self, follower_id, following_ids):
+        pass
+
+
+class RedisFollowGraph:
+    """
+    Adjacency shared by all processes: followers:{id} and followings:{id} sorted sets, member=user id,
+    score=follow time in microseconds. Equal scores are ordered by member, the same tie-break as the database. A set is streamed in from Follow on its first read and lives for ttl,
+    the {key}:loaded marker tells a complete set from one that only received writes since it expired. Unfollows are
+    also kept in {key}:removed for ttl, so a load whose database snapshot still holds them doesn't bring them back.
+    """
+
+    def __init__(self, url, ttl, chunk_size=1000):
+        from redis import asyncio as redis
+
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.redis = redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def get_key(kind, user_id):
+        return f"{kind}:{user_id}"
+
+    async def load(self, kind, user_id):
+        key = self.get_key(kind, user_id)
+        if await self.redis.exists(f"{key}:loaded"):
+            return key
+
+        listed_field, owner_field = EDGE_FIELDS[kind]
+        # values(): values_list() runs its query outside the sync thread when iterated with aiterator()
+        rows = Follow.objects.filter(**{owner_field: user_id}).values(listed_field, "created_time")
+        # streamed into a key of its own, readers never see a partial set and the live key keeps taking writes
+        loading_key = f"{key}:loading:{uuid4().hex}"
+        chunk = {}
+        async for row in rows.aiterator(chunk_size=self.chunk_size):
+            chunk[str(row[listed_field])] = to_score(row["created_time"])
+            if len(chunk) >= self.chunk_size:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.zadd(loading_key, chunk)
+                    pipe.expire(loading_key, self.ttl)  # left behind by a loader that dies
+                    await pipe.execute()
+                chunk = {}
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if chunk:
+                pipe.zadd(loading_key, chunk)
+            # follows added meanwhile are kept, unfollows made after the snapshot are taken out again
+            pipe.zunionstore(key, [key, loading_key], aggregate="MAX")
+            pipe.zdiffstore(key, [key, f"{key}:removed"])
+            pipe.delete(loading_key)
+            pipe.expire(key, self.ttl)
+            pipe.set(f"{key}:loaded", 1, ex=self.ttl)
+            await pipe.execute()
+        return key
+
+    async def _range(self, key, cursor, count):
+        """
+        count members after cursor, newest first. The members sharing the cursor's score are read whole and
+        filtered on the user id, in the same round trip as the older ones.
+        """
+        if cursor is None:
+            rows = await self.redis.zrevrangebyscore(key, "+inf", "-inf", start=0, num=count, withscores=True)
+        else:
+            score, user_id = cursor
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zrevrangebyscore(key, score, score, withscores=True)
+                pipe.zrevrangebyscore(key, f"({score}", "-inf", start=0, num=count, withscores=True)
+                ties, older = await pipe.execute()
+            rows = [(member, tie_score) for member, tie_score in ties if member < str(user_id)] + older
+        return [(UUID(member), int(score)) for member, score in rows[:count]]
+
+    async def page(self, kind, user_id, cursor=None, limit=None):
+        key = await self.load(kind, user_id)
+        return _page(await self._range(key, cursor, limit + 1), limit)
+
+    async def mutuals(self, user_id, cursor=None, limit=None):
+        """
+        Walk the followings newest first and keep those that follow back, one ZMSCORE per batch: O(k) for the k
+        followings scanned, the follower set is never read whole. At most FOLLOW_MUTUALS_SCAN_LIMIT are scanned
+        per page, the returned cursor continues the scan.
+        """
+        followings_key = await self.load(FOLLOWINGS, user_id)
+        followers_key = await self.load(FOLLOWERS, user_id)
+        mutuals = []
+        scanned = 0
+        while len(mutuals) <= limit and scanned < settings.FOLLOW_MUTUALS_SCAN_LIMIT:
+            batch = await self._range(followings_key, cursor, limit + 1)
+            if not batch:
+                return mutuals, None
+            follower_scores = await self.redis.zmscore(followers_key, [str(user_id) for user_id, score in batch])
+            mutuals += [row for row, follower_score in zip(batch, follower_scores) if follower_score is not None]
+            last_user_id, last_score = batch[-1]
+            cursor = last_score, last_user_id
+            scanned += len(batch)
+
+        if len(mutuals) > limit:
+            return _page(mutuals, limit)
+        return mutuals, format_cursor((last_user_id, last_score))
+
+    async def added(self, follower_id, edges):
+        if not edges:
+            return
+        followings_key = self.get_key(FOLLOWINGS, follower_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(followings_key, {str(following_id): score for following_id, score in edges})
+            pipe.expire(followings_key, self.ttl, nx=True)  # sets created by writes alone expire too
+            pipe.zrem(f"{followings_key}:removed", *(str(following_id) for following_id, score in edges))
+            for following_id, score in edges:
+                followers_key = self.get_key(FOLLOWERS, following_id)
+                pipe.zadd(followers_key, {str(follower_id): score})
+                pipe.expire(followers_key, self.ttl, nx=True)
+                pipe.zrem(f"{followers_key}:removed", str(follower_id))
+            await pipe.execute()
+
+    async def removed(self, follower_id, following_ids):
+        if not following_ids:
+            return
+        followings_key = self.get_key(FOLLOWINGS, follower_id)
+        members = [str(following_id) for following_id in following_ids]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrem(followings_key, *members)
+            pipe.zadd(f"{followings_key}:removed", dict.fromkeys(members, 0))
+            pipe.expire(f"{followings_key}:removed", self.ttl)
+            for following_id in following_ids:
+                followers_key = self.get_key(FOLLOWERS, following_id)
+                pipe.zrem(followers_key, str(follower_id))
+                pipe.zadd(f"{followers_key}:removed", {str(follower_id): 0})
+                pipe.expire(f"{followers_key}:removed", self.ttl)
+            await pipe.execute()
+
+
+def get_follow_graph():
+    if settings.FOLLOW_GRAPH_REDIS_URL:
+        return RedisFollowGraph(settings.FOLLOW_GRAPH_REDIS_URL, ttl=settings.FOLLOW_GRAPH_TTL)
+    return DatabaseFollowGraph()
+
+
+follow_graph = get_follow_graph()
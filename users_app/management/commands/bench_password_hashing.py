@@ -0,0 +1,71 @@
+import asyncio
+import os
+from statistics import quantiles
+from time import perf_counter
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from shared_app.hashing import acheck_password, amake_password, shutdown_hashing_executor
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark password checks through the hashing executor: logins/s, logins/s per core, p50/p99 latency "
+        "and the longest event loop stall while hashing. Pure hashing, no database access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=64, help="simultaneous logins")
+        parser.add_argument("--duration", type=float, default=10, help="seconds")
+        parser.add_argument("--executor", choices=["thread", "process"], default=settings.PASSWORD_HASHING_EXECUTOR)
+        parser.add_argument("--workers", type=int, default=settings.PASSWORD_HASHING_WORKERS)
+        parser.add_argument("--iterations", type=int, default=settings.PASSWORD_PBKDF2_ITERATIONS,
+                            help="PBKDF2 iterations, 0 keeps Django's default")
+
+    def handle(self, *args, **options):
+        with override_settings(
+            PASSWORD_HASHING_EXECUTOR=options["executor"],
+            PASSWORD_HASHING_WORKERS=options["workers"],
+            PASSWORD_PBKDF2_ITERATIONS=options["iterations"],
+        ):
+            shutdown_hashing_executor()  # the next call builds a pool with the overridden settings
+            try:
+                asyncio.run(self.run(**options))
+            finally:
+                shutdown_hashing_executor()
+
+    async def run(self, concurrency, duration, executor, workers, **options):
+        password = "correct horse battery staple"
+        encoded = await amake_password(password)
+        await acheck_password(password, encoded)  # warm up the pool
+
+        latencies = []
+        loop_lags = [0.0]
+        stop_at = perf_counter() + duration
+
+        async def login():
+            while perf_counter() < stop_at:
+                started = perf_counter()
+                if not await acheck_password(password, encoded):
+                    raise AssertionError("password check failed")
+                latencies.append(perf_counter() - started)
+
+        async def loop_monitor(interval=0.01):
+            # anything hashing on the loop thread shows up as a stall here
+            while perf_counter() < stop_at:
+                started = perf_counter()
+                await asyncio.sleep(interval)
+                loop_lags.append(perf_counter() - started - interval)
+
+        await asyncio.gather(loop_monitor(), *(login() for _ in range(concurrency)))
+
+        cores = min(workers, os.cpu_count() or 1)
+        logins_per_second = len(latencies) / duration
+        p50, p99 = (quantiles(latencies, n=100)[i] for i in (49, 98)) if len(latencies) > 1 else (0, 0)
+        self.stdout.write(f"hasher={get_hasher('default').algorithm} executor={executor} workers={workers} "
+                          f"concurrency={concurrency} duration={duration}s")
+        self.stdout.write(f"logins={len(latencies)} logins/s={logins_per_second:.1f} "
+                          f"logins/s/core={logins_per_second / cores:.1f} ({cores} cores used)")
+        self.stdout.write(f"latency p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+        self.stdout.write(f"max event loop stall={max(loop_lags) * 1000:.1f}ms")
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:05
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_follow_counts(apps, schema_editor):
+    CustomUser = apps.get_model('users_app', 'CustomUser')
+    Follow = apps.get_model('users_app', 'Follow')
+
+    def count_subquery(field_name):
+        counts = Follow.objects.filter(**{field_name: OuterRef('pk')}).order_by().values(field_name).annotate(
+            count=Count('id')
+        ).values('count')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    CustomUser.objects.update(
+        followers_count=count_subquery('following'), followings_count=count_subquery('follower'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_app', '0003_customuser_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='followings_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_follow_counts, migrations.RunPython.noop),
+    ]
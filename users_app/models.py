@@ -1,11 +1,18 @@
 from dirtyfields import DirtyFieldsMixin
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import DatabaseError, models, transaction
+from django.db.models.functions import Lower
 from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.tokens import RefreshToken
+from shared_app.hashing import is_password_hashed
 from shared_app.models import BaseModel
 
 
+DEFAULT_AVATAR = "defaults/default_avatar.png"
+# maintained with F() updates by users_app.follows, never written back from a loaded instance
+FOLLOW_COUNT_FIELDS = ("followers_count", "followings_count")
+
+
 def user_directory_path(instance, filename):
     # file will be uploaded to user_<username>/<filename>
     return "users/user_{}/{}".format(instance.username, filename)
@@ -51,8 +58,11 @@ class CustomUser(AbstractUser, BaseModel, DirtyFieldsMixin):
     youtube_channel = models.CharField(null=True, blank=True, max_length=100)
     github_username = models.CharField(null=True, blank=True, max_length=100)
     education = models.CharField(null=True, blank=True, max_length=50)
-    avatar = models.ImageField(upload_to=user_directory_path, default="defaults/default_avatar.png")
+    avatar = models.ImageField(upload_to=user_directory_path, default=DEFAULT_AVATAR)
     banner = models.ImageField(upload_to=user_directory_path, default="defaults/default_banner.png")
+    image_variants = models.JSONField(default=dict, blank=True)  # {"avatar": {"64": name, ...}, "banner": {...}}
+    followers_count = models.PositiveIntegerField(default=0)  # users following this user
+    followings_count = models.PositiveIntegerField(default=0)  # users this user follows
     profession = models.OneToOneField(
         Profession,
         related_name="users",
@@ -62,11 +72,18 @@ class CustomUser(AbstractUser, BaseModel, DirtyFieldsMixin):
         max_length=50,
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # case-insensitive full name uniqueness check, see CustomSerializerValidator.validate_to_user_exists
+            models.Index(Lower("first_name"), Lower("last_name"), name="user_full_name_lower_idx"),
+        ]
+
     def __str__(self):
         return self.username
 
     def hashing_password(self):
-        if not self.password.startswith("pbkdf2_sha256"):
+        # fallback for raw passwords, async code paths hash in shared_app.hashing before saving
+        if self.password and not is_password_hashed(self.password):
             self.set_password(self.password)
 
     def get_user_tokens(self):
@@ -75,7 +92,25 @@ class CustomUser(AbstractUser, BaseModel, DirtyFieldsMixin):
 
     def save(self, *args, **kwargs):
         self.hashing_password()
-        super(CustomUser, self).save(*args, **kwargs)
+        if self._state.adding or kwargs.get("update_fields") is not None or kwargs.get("force_insert"):
+            return super(CustomUser, self).save(*args, **kwargs)
+        kwargs.pop("update_fields", None)
+
+        skipped_fields = {*FOLLOW_COUNT_FIELDS, *self.get_deferred_fields()}
+        update_fields = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in skipped_fields and field.name not in skipped_fields
+        ]
+        using = kwargs.get("using") or self._state.db
+        try:
+            # savepoint, so a failed update doesn't break an enclosing transaction before the fallback
+            with transaction.atomic(using=using):
+                super(CustomUser, self).save(*args, update_fields=update_fields, **kwargs)
+        except DatabaseError:
+            # update_fields doesn't fall back to an INSERT, a plain save of a row deleted meanwhile does
+            if type(self)._base_manager.using(using).filter(pk=self.pk).exists():
+                raise
+            super(CustomUser, self).save(*args, force_insert=True, **kwargs)
 
 
 class Follow(BaseModel):
@@ -86,12 +121,17 @@ class Follow(BaseModel):
         constraints = [
             models.UniqueConstraint(fields=["follower", "following"], name="follower_following_unique"),
         ]
+        indexes = [
+            # newest-first follower/following pages, see users_app.follows
+            models.Index(fields=["following", "-created_time"], name="follow_following_time_idx"),
+            models.Index(fields=["follower", "-created_time"], name="follow_follower_time_idx"),
+        ]
 
     def __str__(self):
         return f"{self.follower} followed to {self.following}"
 
     def save(self, *args, **kwargs):
-        if self.follower == self.following:
+        if self.follower_id == self.following_id:
             raise ValidationError("You cannot follow yourself")
         super().save(*args, **kwargs)
 
@@ -1,16 +1,17 @@
+from django.conf import settings
 from django.db.models import Q
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 from adrf.serializers import ModelSerializer, Serializer
 from .models import AuthType, CustomUser, Note, Tab, Profession
-from django.contrib.auth import authenticate
 from .tasks import send_email_or_sms
-from django.core.cache import cache
 import random
 from uuid import uuid4
-import json
 from asgiref.sync import sync_to_async
+from shared_app.cache import cache_get, cache_set
+from shared_app.hashing import aauthenticate, amake_password
 from shared_app.serializer_validator import CustomSerializerValidator
+from shared_app.utils import get_srcset
 
 
 def get_temporary_user_token(request, for_verify=False):
@@ -23,22 +24,14 @@ def get_temporary_user_token(request, for_verify=False):
 
 
 async def get_extended_register_data(temporary_user_token, for_verify=False):
-    json_extended_register_data = await cache.aget(temporary_user_token)
-    print("📝 json_extended_register_data in get_extended_register_data", json_extended_register_data)
+    extended_register_data = await cache_get(temporary_user_token) if temporary_user_token else None
+    print("📝 extended_register_data in get_extended_register_data ", extended_register_data)
 
-    if json_extended_register_data is None:
-        if for_verify:
-            raise ValidationError({"error": "The code has expired or you provided an invalid code."})
-        return None
-
-    try:
-        extended_register_data = json.loads(json_extended_register_data)
-        print("📝 extended_register_data in get_extended_register_data ", extended_register_data)
-        return extended_register_data
-    except json.JSONDecodeError:
-        print("error in get_extended_register_data :::: JSONDecodeError")
+    if extended_register_data is None and for_verify:
         raise ValidationError({"error": "The code has expired or you provided an invalid code."})
 
+    return extended_register_data
+
 
 class RegisterSerializer(Serializer):
     username = serializers.CharField(required=False, allow_null=True)
@@ -101,14 +94,12 @@ class RegisterSerializer(Serializer):
             temporary_user_token: temporary_user_token,
             code: code,
             **data,
+            # hashed now, off the event loop, so the cache never holds the raw password and acreate doesn't hash
+            "password": await amake_password(password),
         }
         print(f"1.2) 📝extended_register_data >> {extended_register_data}")
 
-        try:
-            json_extended_register_data = json.dumps(extended_register_data)
-            await cache.aset(temporary_user_token, json_extended_register_data, 60 * 20)
-        except Exception as e:
-            print(f"🥶error in validate {e}")
+        if not await cache_set(temporary_user_token, extended_register_data, 60 * 20):
             raise ValidationError(
                 {"detail": "An error occurred while saving credentials to cache."}
             )
@@ -202,7 +193,7 @@ class LoginSerializer(Serializer):
         if password is None:
             raise ValidationError({"detail": "Password must be provided.", "code": "password_not_provided"})
 
-        user = await sync_to_async(authenticate)(self.request, username=username, password=password)
+        user = await aauthenticate(username=username, password=password)
         if user is None:
             raise ValidationError({"detail": "User not found.", "code": "user_not_found"})
 
@@ -223,11 +214,13 @@ class CustomUserSerializer(ModelSerializer):
     profession = serializers.PrimaryKeyRelatedField(queryset=Profession.objects.all(), write_only=True)
     avatar = serializers.ImageField()
     banner = serializers.ImageField()
+    avatar_srcset = serializers.SerializerMethodField(read_only=True)
+    banner_srcset = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = CustomUser
         fields = [
-            "id", "username", "followers", "followings", "avatar", "banner", "banner_color",
+            "id", "username", "followers", "followings", "avatar", "banner", "avatar_srcset", "banner_srcset", "banner_color",
             "first_name", "last_name", "email", "phone_number", "date_of_birth", "date_joined",
             "gender", "location", "bio", "telegram_username", "instagram_username", "twitter_username",
             "youtube_channel", "github_username", "profession", "profession_name", "education", "password",
@@ -235,11 +228,19 @@ class CustomUserSerializer(ModelSerializer):
 
     @staticmethod
     def get_followers(obj):
-        return obj.follower.count()
+        return obj.followers_count
 
     @staticmethod
     def get_followings(obj):
-        return obj.following.count()
+        return obj.followings_count
+
+    @staticmethod
+    def get_avatar_srcset(obj):
+        return get_srcset(obj, "avatar")
+
+    @staticmethod
+    def get_banner_srcset(obj):
+        return get_srcset(obj, "banner")
 
     @staticmethod
     def get_profession_name(obj):
@@ -264,7 +265,8 @@ class CustomUserSerializer(ModelSerializer):
             "education": CustomSerializerValidator.validate_education(education),
             "bio": CustomSerializerValidator.validate_bio(bio),
             "user_exists": await CustomSerializerValidator.validate_to_user_exists(
-                username, email, phone_number, first_name, last_name
+                username, email, phone_number, first_name, last_name,
+                exclude_user_id=self.instance.id if self.instance else None,
             ),
             "social": CustomSerializerValidator.validate_social_media(
                 telegram_username, instagram_username, twitter_username, youtube_channel, github_username
@@ -310,6 +312,8 @@ class CustomUserSerializer(ModelSerializer):
         print(f"aupdate validated_data >> {validated_data}")
         for key, value in (await validated_data).items():
             print(f"aupdate key >> {key}: value >> {value}")
+            if key == "password" and value:
+                value = await amake_password(value)
             setattr(instance, key, value)
         await sync_to_async(instance.save)()
         print(f"aupdate instance.username >> {instance.username}")
@@ -428,3 +432,23 @@ class CustomUsersSerializer(ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ["id", "username", "email", "phone_number"]
+
+
+class FollowUserSerializer(ModelSerializer):
+    class Meta:
+        model = CustomUser
+        fields = ["id", "username", "first_name", "last_name", "avatar"]
+
+
+class FollowBulkSerializer(serializers.Serializer):
+    follow = serializers.ListField(child=serializers.UUIDField(), required=False, default=list)
+    unfollow = serializers.ListField(child=serializers.UUIDField(), required=False, default=list)
+
+    def validate(self, data):
+        if len(data["follow"]) + len(data["unfollow"]) > settings.FOLLOW_BULK_MAX_OPS:
+            raise ValidationError(
+                {"detail": f"At most {settings.FOLLOW_BULK_MAX_OPS} operations per request.", "code": "too_many_ops"}
+            )
+        if set(data["follow"]) & set(data["unfollow"]):
+            raise ValidationError({"detail": "A user can't be followed and unfollowed at once.", "code": "conflicting_ops"})
+        return data
@@ -1,62 +1,70 @@
-import shutil
-from asgiref.sync import sync_to_async
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from shared_app.utils import get_dominant_color_async, get_s3_client_async
-from users_app.models import CustomUser
-from pathlib import Path
-from django.conf import settings
-from asyncio import to_thread
+from django.db import transaction
+from config.middleware import user_snapshot_cache
+from shared_app.content_store import release_content
+from shared_app.tasks import generate_image_variants_task, needs_image_variants
+from users_app.follows import change_follow_counts, is_counted_in_batch
+from users_app.models import CustomUser, Follow
+from users_app.tasks import delete_user_media, update_banner_color
 
 
-BASE_DIR = Path(__file__).resolve().parent.parent
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_snapshot_on_save(sender, instance, created, **kwargs):
+    if not created:
+        # a deactivated or changed user must not keep authenticating WebSockets from the cached copy
+        user_snapshot_cache.invalidate(instance.pk)
 
 
-async def update_banner_color(instance):
-    """Helper function to update banner color."""
-    if settings.STORAGE_DESTINATION == "s3":
-        object_key = instance.banner.name
-        dominant_color = get_dominant_color_async(object_key=object_key)
-        if dominant_color:
-            instance.banner_color = dominant_color
-    elif settings.STORAGE_DESTINATION == "local":
-        banner_path = instance.banner.path
-        dominant_color = await get_dominant_color_async(path=banner_path)
-        if dominant_color:
-            instance.banner_color = dominant_color
-            await sync_to_async(instance.save)()
+@receiver(post_save, sender=CustomUser)
+def set_banner_color_when_user_created(sender, instance, created, **kwargs):
+    if created or "banner" in instance.get_dirty_fields():
+        user_id = instance.id
+        transaction.on_commit(lambda: update_banner_color.delay(user_id))
 
 
 @receiver(post_save, sender=CustomUser)
-async def set_banner_color_when_user_created(sender, instance, created, **kwargs):
-    print(f"sender: {sender}")
-    if created or "banner" in instance.get_dirty_fields():
-        await update_banner_color(instance)
+def generate_avatar_and_banner_variants(sender, instance, created, **kwargs):
+    field_names = [field_name for field_name in ("avatar", "banner") if needs_image_variants(instance, field_name)]
+    if field_names:
+        user_id = instance.id
+        transaction.on_commit(lambda: generate_image_variants_task.delay("users_app.CustomUser", user_id, field_names))
+
+
+@receiver(post_save, sender=CustomUser)
+def release_replaced_avatar_and_banner(sender, instance, created, **kwargs):
+    if created:
+        return
+    dirty_fields = instance.get_dirty_fields()
+    for field_name in ("avatar", "banner"):
+        if field_name in dirty_fields:
+            old_value = dirty_fields[field_name]
+            release_content(getattr(old_value, "name", old_value))
 
 
 @receiver(post_delete, sender=CustomUser)
-async def delete_user_avatar_and_banner(sender, instance, **kwargs):
-    print(f"sender: {sender}")
-    if settings.STORAGE_DESTINATION == "s3":
-        s3, aws_storage_bucket_name = await get_s3_client_async()
-        user_folder_key = f"{settings.MEDIA_LOCATION}/users/user_{instance.username}/"
-
-        objects_to_delete = await to_thread(
-            s3.list_objects_v2(Bucket=aws_storage_bucket_name, Prefix=user_folder_key)
-        )
-        if "Contents" in objects_to_delete:
-            delete_keys = [{"Key": obj["Key"]} for obj in objects_to_delete["Contents"]]
-            await to_thread(
-                s3.delete_objects(Bucket=aws_storage_bucket_name, Delete={"Objects": delete_keys})
-            )
-
-    elif settings.STORAGE_DESTINATION == "local":
-        # instance.avatar.name >> defaults/default_avatar.png
-        # instance.avatar.url >> media/defaults/default_avatar.png
-        # instance.banner.path >> /home/kamronbek/Desktop/backend_1/media/defaults/default_banner.png
-        user_folder_path = Path(instance.avatar.path).parent
-        if Path(user_folder_path).exists() and instance.avatar.name != "defaults/default_avatar.png":
-            try:
-                await to_thread(shutil.rmtree, user_folder_path, ignore_errors=True, onerror=None)
-            except Exception as e:
-                print(f"Error deleting user folder: {e}")
+def invalidate_user_snapshot_on_delete(sender, instance, **kwargs):
+    user_snapshot_cache.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=CustomUser)
+def delete_user_avatar_and_banner(sender, instance, **kwargs):
+    # shared content-addressed images lose a reference, the user's own folder is removed in the background
+    for image in (instance.avatar, instance.banner):
+        release_content(image.name)
+
+    username = instance.username
+    transaction.on_commit(lambda: delete_user_media.delay(username))
+
+
+@receiver(post_save, sender=Follow)
+def increment_follow_counts(sender, instance, created, **kwargs):
+    if created:
+        change_follow_counts(instance.follower_id, [instance.following_id], 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_follow_counts(sender, instance, **kwargs):
+    if is_counted_in_batch():
+        return  # unfollow_users updates the counters once for all its rows
+    change_follow_counts(instance.follower_id, [instance.following_id], -1)
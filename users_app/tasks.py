@@ -1,8 +1,16 @@
+import hashlib
+import shutil
+from pathlib import Path
+from django.core.cache import cache
 from django.core.mail import send_mail
 from config.celery import app
 from django.conf import settings
-from users_app.models import AuthType
-from shared_app.utils import send_sms
+from users_app.follows import reconcile_follow_counts
+from users_app.models import DEFAULT_AVATAR, AuthType, CustomUser
+from shared_app.content_store import release_content, store_content
+from shared_app.s3 import delete_prefix
+from shared_app.tasks import generate_image_variants_task
+from shared_app.utils import download_image, get_dominant_color, get_image_extension, prepare_image, send_sms
 
 
 @app.task()
@@ -21,3 +29,73 @@ def send_email_or_sms(auth_type, email_subject=None, email_message=None, email=N
         send_sms(
             phone_number=phone_number,
         )
+
+
+@app.task(ignore_result=True)
+def update_banner_color(user_id):
+    user = CustomUser.objects.only("id", "username", "banner").filter(id=user_id).first()
+    if user is None or not user.banner:
+        return
+
+    with user.banner.open("rb") as banner_file:
+        dominant_color = get_dominant_color(banner_file, sample_size=settings.BANNER_COLOR_SAMPLE_SIZE)
+
+    if dominant_color:
+        # targeted update: no save(), no password re-hash, no post_save re-entry
+        CustomUser.objects.filter(id=user_id).update(banner_color=dominant_color)
+
+
+@app.task(bind=True, max_retries=3, default_retry_delay=60)
+def delete_user_media(self, username):
+    """remove users/user_<username>/ from storage after the user row is gone"""
+    if settings.STORAGE_DESTINATION == "s3":
+        def report_progress(deleted, failed):
+            self.update_state(state="PROGRESS", meta={"deleted": deleted, "failed": failed})
+
+        deleted, failed_keys = delete_prefix(
+            f"{settings.MEDIA_LOCATION}users/user_{username}/", on_progress=report_progress,
+        )
+        print(f"🗑️ deleted {deleted} objects of user_{username}, {len(failed_keys)} failed")
+        if failed_keys:
+            # the next run lists the prefix again, so only what is left gets deleted
+            raise self.retry()
+        return {"deleted": deleted}
+
+    elif settings.STORAGE_DESTINATION == "local":
+        user_folder_path = Path(settings.MEDIA_ROOT) / "users" / f"user_{username}"
+        shutil.rmtree(user_folder_path, ignore_errors=True)
+
+
+@app.task(ignore_result=True)
+def reconcile_follow_counts_task():
+    fixed = reconcile_follow_counts()
+    print(f"🔢 follow counters fixed for {fixed} users")
+
+
+def get_avatar_import_key(user_id, photo_url):
+    return f"avatar_import:{user_id}:{hashlib.sha1(photo_url.encode()).hexdigest()}"
+
+
+def schedule_avatar_import(user_id, photo_url):
+    """queue import_avatar unless the same photo is already being imported for this user"""
+    if cache.add(get_avatar_import_key(user_id, photo_url), 1, settings.AVATAR_IMPORT_LOCK_TTL):
+        import_avatar.delay(user_id, photo_url)
+        return True
+    return False
+
+
+@app.task(ignore_result=True)
+def import_avatar(user_id, photo_url):
+    """download a social login photo into content-addressed storage and put it in place of the placeholder"""
+    try:
+        image_bytes = prepare_image(download_image(photo_url))
+        avatar_key = store_content(image_bytes, get_image_extension())
+        # only the placeholder is replaced, an avatar the user uploaded meanwhile wins
+        if CustomUser.objects.filter(id=user_id, avatar=DEFAULT_AVATAR).update(avatar=avatar_key):
+            generate_image_variants_task.delay("users_app.CustomUser", user_id, ["avatar"])
+        else:
+            release_content(avatar_key)
+    except Exception as e:
+        print(f"🥶 error importing avatar of user {user_id}: {e}")
+    finally:
+        cache.delete(get_avatar_import_key(user_id, photo_url))
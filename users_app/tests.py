@@ -1,3 +1,306 @@
-from django.test import TestCase
+import asyncio
+from datetime import datetime, timedelta, timezone
+from time import time
+from unittest import mock
+from uuid import uuid4
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from django.test import SimpleTestCase, TestCase
+from config.middleware import get_user, user_snapshot_cache
+from config.firebase_auth import GooglePublicKeys, StaticPublicKeys, load_public_keys, verify_firebase_id_token
+from shared_app.utils import generate_unique_username
+from users_app.follows import (
+    FOLLOWERS,
+    FOLLOWINGS,
+    DatabaseFollowGraph,
+    RedisFollowGraph,
+    follow_users,
+    parse_cursor,
+    reconcile_follow_counts,
+    to_score,
+    unfollow_users,
+)
+from users_app.models import CustomUser, Follow
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def create_users(count):
+    # bulk_create sends no post_save, so no task is queued on commit
+    return CustomUser.objects.bulk_create([CustomUser(username=f"user_{number}") for number in range(count)])
+
+
+class FollowCountTests(TestCase):
+    def setUp(self):
+        self.follower, *self.others = create_users(4)
+
+    def assertCounts(self, user, followers, followings):
+        user.refresh_from_db()
+        self.assertEqual((user.followers_count, user.followings_count), (followers, followings))
+
+    def test_follow_and_unfollow_update_counts_once(self):
+        other_ids = [user.id for user in self.others]
+        self.assertEqual(len(follow_users(self.follower.id, other_ids)), 3)
+        self.assertEqual(follow_users(self.follower.id, other_ids), [])
+        self.assertCounts(self.follower, 0, 3)
+        self.assertCounts(self.others[0], 1, 0)
+
+        self.assertEqual(len(unfollow_users(self.follower.id, other_ids[:2])), 2)
+        self.assertEqual(unfollow_users(self.follower.id, other_ids[:2]), [])
+        self.assertCounts(self.follower, 0, 1)
+        self.assertCounts(self.others[0], 0, 0)
+        self.assertCounts(self.others[2], 1, 0)
+
+    def test_single_follow_and_delete_update_counts(self):
+        follow = Follow.objects.create(follower=self.follower, following=self.others[0])
+        self.assertCounts(self.follower, 0, 1)
+        follow.delete()
+        self.assertCounts(self.follower, 0, 0)
+        self.assertCounts(self.others[0], 0, 0)
+
+    def test_follow_of_missing_user_or_self_is_ignored(self):
+        added = follow_users(self.follower.id, [self.follower.id, self.others[0].id])
+        self.assertEqual(added, [(self.others[0].id, to_score(Follow.objects.get().created_time))])
+        self.assertCounts(self.follower, 0, 1)
+
+    def test_reconcile_fixes_drifted_counts(self):
+        follow_users(self.follower.id, [user.id for user in self.others])
+        CustomUser.objects.filter(id=self.follower.id).update(followings_count=10, followers_count=2)
+        self.assertEqual(reconcile_follow_counts(), 1)
+        self.assertCounts(self.follower, 0, 3)
+        self.assertEqual(reconcile_follow_counts(), 0)
+
+
+class GenerateUniqueUsernameTests(TestCase):
+    async def test_next_suffix_ignores_other_names_sharing_the_prefix(self):
+        self.assertEqual(await generate_unique_username("John Doe"), "john_doe")
+        await CustomUser.objects.abulk_create([
+            CustomUser(username=username) for username in ("john_doe", "john_doe_2", "john_doeman", "john_doe_x")
+        ])
+        self.assertEqual(await generate_unique_username("John Doe"), "john_doe_3")
+
+
+class FirebaseSocialAuthTests(TestCase):
+    def sign_in(self, **profile):
+        profile = {"display_name": None, "email": None, "phone_number": None, "photo_url": None, **profile}
+        with mock.patch("users_app.views.custom_firebase_validation", new=mock.AsyncMock(return_value=profile)):
+            return self.client.post(
+                "/api/v1/users/firebase-auth/", {"firebase_id_token": "token"}, content_type="application/json",
+            )
+
+    def test_phone_sign_in_never_matches_a_user_without_email(self):
+        create_users(1)  # username user_0, no email
+        response = self.sign_in(phone_number="+998901234567")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["username"], "user")
+        self.assertEqual(CustomUser.objects.get(username="user").phone_number, "+998901234567")
+
+        self.assertEqual(self.sign_in(phone_number="+998901234567").json()["username"], "user")
+        self.assertEqual(CustomUser.objects.count(), 2)
+
+    def test_email_sign_in_finds_the_user_by_email(self):
+        CustomUser.objects.bulk_create([CustomUser(username="john", email="john@example.com")])
+        response = self.sign_in(display_name="John", email="john@example.com")
+        self.assertEqual(response.json()["username"], "john")
+
+    def test_token_without_email_or_phone_is_rejected(self):
+        self.assertEqual(self.sign_in(display_name="Nobody").status_code, 400)
+
+
+class WebSocketUserCacheTests(TestCase):
+    def setUp(self):
+        [self.user] = create_users(1)
+        self.token = self.user.get_user_tokens()["access_token"]
+        user_snapshot_cache._users.clear()
+        self.addCleanup(user_snapshot_cache._users.clear)
+
+    async def test_second_lookup_is_served_from_the_cache(self):
+        self.assertEqual((await get_user(self.token)).id, self.user.id)
+        with mock.patch.object(type(CustomUser.objects), "aget", side_effect=AssertionError("queried")):
+            self.assertEqual((await get_user(self.token)).id, self.user.id)
+
+    async def test_save_and_delete_invalidate_the_cached_user(self):
+        await get_user(self.token)
+        self.user.is_active = False
+        await self.user.asave()
+        self.assertFalse((await get_user(self.token)).is_authenticated)
+
+        await get_user(self.token)
+        with mock.patch("users_app.signals.transaction.on_commit"):
+            await self.user.adelete()
+        self.assertFalse((await get_user(self.token)).is_authenticated)
+
+
+class CustomUserSaveTests(TestCase):
+    def test_save_keeps_follow_counts(self):
+        [user] = create_users(1)
+        CustomUser.objects.filter(id=user.id).update(followers_count=5, followings_count=3)
+        user.bio = "bio"
+        user.save()
+
+        user.refresh_from_db()
+        self.assertEqual(user.bio, "bio")
+        self.assertEqual((user.followers_count, user.followings_count), (5, 3))
+
+    def test_save_writes_edited_task_fields(self):
+        [user] = create_users(1)
+        user.image_variants = {"avatar": {"64": "avatar_64.webp"}}
+        user.banner_color = "#123456"
+        user.save()
+
+        user.refresh_from_db()
+        self.assertEqual(user.image_variants, {"avatar": {"64": "avatar_64.webp"}})
+        self.assertEqual(user.banner_color, "#123456")
+
+    def test_save_inserts_a_deleted_row(self):
+        [user] = create_users(1)
+        CustomUser.objects.filter(id=user.id).delete()
+        user.bio = "bio"
+        user.save()
+
+        self.assertEqual(CustomUser.objects.get(id=user.id).bio, "bio")
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        self.user, *self.others = create_users(7)
+        # a bulk follow: every row shares one created_time
+        Follow.objects.bulk_create([Follow(follower=self.user, following=other) for other in self.others])
+        Follow.objects.bulk_create([Follow(follower=other, following=self.user) for other in self.others[:4]])
+        Follow.objects.update(created_time=datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+    async def walk(self, graph, kind, limit=2):
+        user_ids, cursor = [], None
+        while True:
+            if kind is None:
+                rows, cursor = await graph.mutuals(self.user.id, parse_cursor(cursor), limit)
+            else:
+                rows, cursor = await graph.page(kind, self.user.id, parse_cursor(cursor), limit)
+            user_ids += [user_id for user_id, score in rows]
+            if cursor is None:
+                return user_ids
+
+    async def assertWalks(self, graph):
+        followings = sorted((other.id for other in self.others), reverse=True)
+        followers = sorted((other.id for other in self.others[:4]), reverse=True)
+        self.assertEqual(await self.walk(graph, FOLLOWINGS), followings)
+        self.assertEqual(await self.walk(graph, FOLLOWERS), followers)
+        self.assertEqual(await self.walk(graph, None), followers)
+
+    async def test_database_pages_walk_rows_with_the_same_time(self):
+        await self.assertWalks(DatabaseFollowGraph())
+
+    async def test_redis_pages_walk_rows_with_the_same_score(self):
+        if fakeredis is None:
+            self.skipTest("fakeredis is not installed")
+        graph = RedisFollowGraph("redis://localhost:6379", ttl=60)
+        graph.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        await self.assertWalks(graph)
+
+    async def test_redis_load_drops_unfollows_made_after_the_snapshot(self):
+        if fakeredis is None:
+            self.skipTest("fakeredis is not installed")
+        graph = RedisFollowGraph("redis://localhost:6379", ttl=60, chunk_size=2)
+        graph.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        unfollowed, late_id = self.others[0], uuid4()
+        # the Follow row is still there, as in a snapshot taken before the unfollow committed
+        await graph.removed(self.user.id, [unfollowed.id])
+        await graph.added(self.user.id, [(late_id, to_score(datetime.now(timezone.utc)))])
+
+        followings = await self.walk(graph, FOLLOWINGS)
+        self.assertNotIn(unfollowed.id, followings)
+        self.assertIn(late_id, followings)
+        self.assertEqual(len(followings), len(self.others))
+        rows, cursor = await graph.page(FOLLOWERS, unfollowed.id, limit=10)
+        self.assertEqual(rows, [])
+        self.assertEqual(await graph.redis.keys("*:loading:*"), [])
+
+        # following again lifts the tombstone for the next load
+        await graph.added(self.user.id, [(unfollowed.id, to_score(datetime.now(timezone.utc)))])
+        await graph.redis.delete(f"followings:{self.user.id}", f"followings:{self.user.id}:loaded")
+        self.assertIn(unfollowed.id, await self.walk(graph, FOLLOWINGS))
+
+
+def create_certificate(private_key):
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken")])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .sign(private_key, hashes.SHA256())
+    )
+    return certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class FirebaseIdTokenTests(SimpleTestCase):
+    project_id = "test-project"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.certificates = {"key-1": create_certificate(cls.private_key)}
+
+    def create_token(self, kid="key-1", **claims):
+        now = int(time())
+        claims = {
+            "aud": self.project_id,
+            "iss": f"https://securetoken.google.com/{self.project_id}",
+            "sub": "firebase-uid",
+            "iat": now,
+            "auth_time": now,
+            "exp": now + 3600,
+            **claims,
+        }
+        return jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": kid})
+
+    def verify(self, token, key_source=None):
+        key_source = key_source or StaticPublicKeys(self.certificates)
+        return asyncio.run(verify_firebase_id_token(token, key_source=key_source, project_id=self.project_id))
+
+    def test_valid_token(self):
+        claims = self.verify(self.create_token(email="user@example.com"))
+        self.assertEqual(claims["uid"], "firebase-uid")
+        self.assertEqual(claims["email"], "user@example.com")
+
+    def test_expired_token(self):
+        now = int(time())
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            self.verify(self.create_token(iat=now - 7200, auth_time=now - 7200, exp=now - 3600))
+
+    def test_wrong_audience(self):
+        with self.assertRaises(jwt.InvalidAudienceError):
+            self.verify(self.create_token(aud="another-project"))
+
+    def test_unknown_kid(self):
+        with self.assertRaises(jwt.InvalidTokenError):
+            self.verify(self.create_token(kid="key-2"))
+
+    def test_unknown_kid_refreshes_the_keys_once(self):
+        rotated = {**self.certificates, "key-2": create_certificate(self.private_key)}
+        key_source = GooglePublicKeys(min_refresh_interval=0)
+        fetched = [(load_public_keys(self.certificates), 3600), (load_public_keys(rotated), 3600)]
+        with mock.patch.object(key_source, "fetch", side_effect=fetched) as fetch:
+            self.assertEqual(self.verify(self.create_token(), key_source)["uid"], "firebase-uid")
+            self.assertEqual(self.verify(self.create_token(kid="key-2"), key_source)["uid"], "firebase-uid")
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_keys_without_max_age_are_kept_for_the_default(self):
+        key_source = GooglePublicKeys(default_max_age=600)
+        response = mock.Mock(headers={}, json=mock.Mock(return_value=self.certificates))
+        with mock.patch("config.firebase_auth.requests.get", return_value=response) as get:
+            self.verify(self.create_token(), key_source)
+            self.verify(self.create_token(), key_source)
+        self.assertEqual(get.call_count, 1)
+        self.assertAlmostEqual(key_source.expires_at, time() + 600, delta=5)
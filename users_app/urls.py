@@ -6,7 +6,9 @@ from .views import (
     NotesAPIView, CustomUsersAPIView,
     VerifyAPIView, TabAPIView,
     FirebaseSocialAuthAPIView,
+    FollowAPIView, FollowBulkAPIView, FollowListAPIView,
 )
+from .follows import FOLLOWERS, FOLLOWINGS, MUTUALS
 
 
 urlpatterns = [
@@ -21,4 +23,9 @@ urlpatterns = [
     path('notes/tab/', TabAPIView.as_view()),
     path('token/refresh/', TokenRefreshView.as_view()),
     path('firebase-auth/', FirebaseSocialAuthAPIView.as_view()),
+    path('follows/bulk/', FollowBulkAPIView.as_view()),
+    path('follows/<uuid:user_id>/', FollowAPIView.as_view()),
+    path('<uuid:user_id>/followers/', FollowListAPIView.as_view(kind=FOLLOWERS)),
+    path('<uuid:user_id>/followings/', FollowListAPIView.as_view(kind=FOLLOWINGS)),
+    path('<uuid:user_id>/mutuals/', FollowListAPIView.as_view(kind=MUTUALS)),
 ]
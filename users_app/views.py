@@ -1,3 +1,4 @@
+from django.db import IntegrityError
 from django.utils import timezone
 from asgiref.sync import sync_to_async
 from rest_framework import permissions, status
@@ -6,13 +7,17 @@ from adrf.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 from shared_app.utils import user_credential_generator
-from .models import CustomUser, Note, Tab
+from .models import DEFAULT_AVATAR, CustomUser, Note, Tab
+from .follows import FOLLOWERS, MUTUALS, InvalidFollowCursor, follow_graph, get_page_size, parse_cursor, update_follows
+from .tasks import schedule_avatar_import
 from config.firebase_auth import custom_firebase_validation
 from asyncio import to_thread
 from functools import partial
 from .serializers import (
     CustomUserSerializer,
     CustomUsersSerializer,
+    FollowBulkSerializer,
+    FollowUserSerializer,
     LoginSerializer,
     NoteSerializer,
     RegisterSerializer,
@@ -21,6 +26,9 @@ from .serializers import (
 )
 
 
+USERNAME_ATTEMPTS = 3
+
+
 class RegisterAPIView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -55,59 +63,52 @@ class FirebaseSocialAuthAPIView(APIView):
     permission_classes = [permissions.AllowAny]
 
     async def post(self, request):
-        print(f"📝 REQUEST: {request}")
         firebase_id_token = request.data["firebase_id_token"]
         validate = await custom_firebase_validation(firebase_id_token)
-        if validate is not None:
-            firebase_user_display_name, firebase_user_email, firebase_user_phone_number, firebase_user_photo_url = (
-                validate.get(key) for key in ("display_name", "email", "phone_number", "photo_url")
-            )
+        if validate is None:
+            return Response({"message": "Bad"}, status=status.HTTP_400_BAD_REQUEST)
 
-            print(f"�� firebase_user_display_name: {firebase_user_display_name}")
-            print(f"�� firebase_user_email: {firebase_user_email}")
-            print(f"�� firebase_user_phone_number: {firebase_user_phone_number}")
-            print(f"�� firebase_user_photo_url: {firebase_user_photo_url}")
+        firebase_user_display_name, firebase_user_email, firebase_user_phone_number, firebase_user_photo_url = (
+            validate.get(key) for key in ("display_name", "email", "phone_number", "photo_url")
+        )
 
-            generated_username = await to_thread(
-                partial(user_credential_generator, "username", firebase_user_display_name),
-            )
-            g_username = await generated_username
-            generated_password = await to_thread(partial(user_credential_generator, "password"))
-            g_password = await generated_password
-            generated_avatar_url = await to_thread(
-                partial(user_credential_generator, "avatar", firebase_user_photo_url, g_username),
-            )
-            g_avatar_url = await generated_avatar_url
-
-            try:
-                print(f"📝 g_username: {g_username}")
-                print(f"📝 g_password: {g_password}")
-                print(f"📝 g_avatar_url: {g_avatar_url}")
-            except Exception as e:
-                print(f"�� error: {e}")
-
-            user, created = await sync_to_async(CustomUser.objects.get_or_create)(
-                email=firebase_user_email,
-                defaults={
-                    "username": g_username,
-                    "password": g_password,
-                    "phone_number": firebase_user_phone_number,
-                    "avatar": g_avatar_url,
-                }
-            )
+        # phone sign-ins carry no email, a missing value must never match the users whose column is NULL
+        if firebase_user_email:
+            identity = {"email": firebase_user_email}
+        elif firebase_user_phone_number:
+            identity = {"phone_number": firebase_user_phone_number}
+        else:
+            return Response({"message": "Bad"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # returning users are answered from one lookup, nothing is generated or downloaded for them
+        user = await CustomUser.objects.filter(**identity).afirst()
+        if user is None:
+            g_password = await user_credential_generator("password")
+            for attempt in range(USERNAME_ATTEMPTS):
+                g_username = await user_credential_generator("username", firebase_user_display_name or "")
+                try:
+                    user, created = await CustomUser.objects.aget_or_create(
+                        **identity,
+                        defaults={
+                            "username": g_username,
+                            "password": g_password,
+                            "email": firebase_user_email,
+                            "phone_number": firebase_user_phone_number,
+                        }
+                    )
+                    break
+                except IntegrityError:
+                    # a concurrent signup took the same username, generate the next one
+                    if attempt == USERNAME_ATTEMPTS - 1:
+                        raise
             print(f"🥳 created: {created}\n 🥳 user: {user}")
 
-            if created:
-                created_user_serializer = CustomUserSerializer(user, many=False)
-                data = await created_user_serializer.adata
-                print(f"🥳 created user: {data}")
-                return Response(data, status=status.HTTP_200_OK)
+        if firebase_user_photo_url and user.avatar.name == DEFAULT_AVATAR:
+            # the placeholder is served now, the photo replaces it once the background import finishes
+            await to_thread(schedule_avatar_import, user.id, firebase_user_photo_url)
 
-            user_serializer = CustomUserSerializer(user, many=False)
-            return Response(user_serializer.data, status=status.HTTP_200_OK)
-
-        else:
-            return Response({"message": "Bad"}, status=status.HTTP_400_BAD_REQUEST)
+        user_serializer = CustomUserSerializer(user, many=False)
+        return Response(await user_serializer.adata, status=status.HTTP_200_OK)
 
 
 class LogoutView(APIView):
@@ -246,3 +247,65 @@ class CustomUsersAPIView(APIView):
         users = await sync_to_async(CustomUser.objects.all)()
         users_serializers = CustomUsersSerializer(users, many=True)
         return Response(await users_serializers.adata, status=status.HTTP_200_OK)
+
+
+class FollowAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request, user_id):
+        if user_id == request.user.id:
+            return Response({"detail": "You cannot follow yourself", "code": "self_follow"}, status=status.HTTP_400_BAD_REQUEST)
+        followed, unfollowed = await update_follows(request.user.id, follow_ids=[user_id])
+        if followed:
+            return Response({"following": True}, status=status.HTTP_201_CREATED)
+        # following someone twice is a no-op, only a missing user is an error
+        if not await CustomUser.objects.filter(id=user_id).aexists():
+            return Response({"detail": "User not found.", "code": "user_not_found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"following": True}, status=status.HTTP_200_OK)
+
+    async def delete(self, request, user_id):
+        await update_follows(request.user.id, unfollow_ids=[user_id])
+        return Response({"following": False}, status=status.HTTP_200_OK)
+
+
+class FollowBulkAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        bulk_serializer = FollowBulkSerializer(data=request.data)
+        bulk_serializer.is_valid(raise_exception=True)
+        followed, unfollowed = await update_follows(
+            request.user.id,
+            follow_ids=bulk_serializer.validated_data["follow"],
+            unfollow_ids=bulk_serializer.validated_data["unfollow"],
+        )
+        return Response({"followed": followed, "unfollowed": unfollowed}, status=status.HTTP_200_OK)
+
+
+class FollowListAPIView(APIView):
+    """followers, followings or mutuals of a user, newest follow first, ?cursor=&limit="""
+    permission_classes = [permissions.IsAuthenticated]
+    kind = FOLLOWERS
+
+    async def get(self, request, user_id):
+        try:
+            cursor = parse_cursor(request.query_params.get("cursor"))
+            limit = get_page_size(request.query_params.get("limit"))
+        except InvalidFollowCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if self.kind == MUTUALS:
+            rows, next_cursor = await follow_graph.mutuals(user_id, cursor, limit)
+        else:
+            rows, next_cursor = await follow_graph.page(self.kind, user_id, cursor, limit)
+
+        # only the ids of one page are looked up, the whole list never leaves Redis or the database
+        user_ids = [row_user_id for row_user_id, score in rows]
+        page_users = CustomUser.objects.filter(id__in=user_ids).only(*FollowUserSerializer.Meta.fields)
+        users = {user.id: user async for user in page_users}
+        page_serializer = FollowUserSerializer(
+            [users[row_user_id] for row_user_id in user_ids if row_user_id in users],
+            many=True,
+            context={"request": request},
+        )
+        return Response({"results": await page_serializer.adata, "next": next_cursor}, status=status.HTTP_200_OK)